@@ -1,15 +1,61 @@
 """AI-powered comment generator for social media posts."""
 
 import os
+import re
+import json
 import random
+import time
 import logging
-import base64
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+
+from caption_index import CaptionIndex
+from ai_metrics import get_ai_metrics
+from captions import CaptionBundle
+from comment_store import CommentStore
+from content_cache import JsonStore, content_hash, get_cache_dir
+from vision_input import VisionEncoder
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever the prompts change so cached caption pools are not reused
+PROMPT_VERSION = '2'
+DESCRIBE_PROMPT_VERSION = '1'
+
+
+class LatencyTracker:
+    """Rolling window of call latencies per provider.
+
+    Calls that were abandoned (over budget, or overtaken by a hedge) record
+    how long they had run, so a slow provider's percentile still rises.
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 5):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, seconds: float):
+        """Record the latency of a call (elapsed time so far if abandoned)."""
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, provider: str, pct: float) -> Optional[float]:
+        """Return the given latency percentile, or None without enough samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
 
 class CommentGenerator:
     """Generates AI-powered comments about Lain Iwakura."""
@@ -18,6 +64,17 @@ class CommentGenerator:
         """Initialize the comment generator."""
         self.use_ai = os.getenv('USE_AI_COMMENTS', 'false').lower() == 'true'
         self.ai_provider = os.getenv('AI_PROVIDER', 'openrouter')  # openai, anthropic, or openrouter
+
+        # Ordered failover chain, e.g. "openrouter,anthropic,openai" (default: AI_PROVIDER only)
+        chain = os.getenv('AI_PROVIDER_CHAIN', self.ai_provider)
+        self.provider_chain = [p.strip().lower() for p in chain.split(',') if p.strip()]
+        self.providers: List[str] = []
+
+        # 'direct' sends the image with every caption request; 'two_stage' describes
+        # each image once with a vision model and writes captions with text-only calls
+        self.comment_mode = os.getenv('COMMENT_MODE', 'direct').lower()
+        self.vision_provider = os.getenv('VISION_PROVIDER', 'openrouter').lower()
+        self.description_store = None
         
         # Fallback comments if AI is not available
         self.fallback_comments = [
@@ -38,31 +95,151 @@ class CommentGenerator:
             "Communication defines our existence 📱 #SerialExperimentsLain",
         ]
         
+        # Per-call token, latency and cost accounting (see ai_metrics.py)
+        self.metrics = get_ai_metrics()
+
+        # Reject captions too similar to ones posted recently (see caption_index.py)
+        self.dedupe_attempts = max(1, int(os.getenv('CAPTION_DEDUPE_ATTEMPTS', '3')))
+        self.caption_index = None
+        if os.getenv('CAPTION_DEDUPE', 'true').lower() == 'true':
+            try:
+                self.caption_index = CaptionIndex()
+            except Exception as e:
+                logger.warning(f"Caption dedupe index unavailable: {e}")
+
+        # Keep-alive HTTP connections shared by every request to the provider
+        self.pool_maxsize = int(os.getenv('AI_HTTP_POOL_SIZE', '10'))
+        self.connect_timeout = float(os.getenv('AI_CONNECT_TIMEOUT', '5'))
+        self.read_timeout = float(os.getenv('AI_READ_TIMEOUT', '30'))
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.session = self._create_session()
+        # The AICall being measured by the current thread's SDK request
+        self._sdk_local = threading.local()
+        self.vision_encoder = VisionEncoder()
+
+        # Per-provider latency budget and optional hedging to the next provider
+        self.latency_budget = float(os.getenv('AI_LATENCY_BUDGET', str(self.connect_timeout + self.read_timeout)))
+        self.hedge_enabled = os.getenv('AI_HEDGE', 'false').lower() == 'true'
+        self.hedge_delay = float(os.getenv('AI_HEDGE_DELAY', '8'))
+        self.hedge_percentile = float(os.getenv('AI_HEDGE_PERCENTILE', '95'))
+        self.latency_tracker = LatencyTracker(window=int(os.getenv('AI_LATENCY_WINDOW', '100')))
+        # Abandoned calls keep a worker until they return, so leave headroom beyond the HTTP pool
+        self.chain_workers = int(os.getenv('AI_CHAIN_WORKERS', str(2 * self.pool_maxsize)))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.chain_workers), thread_name_prefix='ai-provider')
+
+        # Pool of pre-generated captions per image (see comment_store.py)
+        self.pool_size = max(1, int(os.getenv('COMMENT_POOL_SIZE', '5')))
+        # Refill a pool in the background once it drops below this many captions
+        self.pool_low_water = max(0, int(os.getenv('COMMENT_POOL_LOW_WATER', '2')))
+        self.comment_store = None
+        self._refill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='comment-refill')
+        self._refills: Dict[str, Future] = {}
+        self._refill_lock = threading.Lock()
+
         if self.use_ai:
             self._init_ai_client()
 
+        if self.use_ai and os.getenv('COMMENT_CACHE', 'true').lower() == 'true':
+            try:
+                self.comment_store = CommentStore()
+            except Exception as e:
+                logger.warning(f"Comment cache unavailable: {e}")
+
+    def _create_session(self) -> requests.Session:
+        """Create a pooled keep-alive session for provider HTTP calls."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _sdk_http_options(self) -> dict:
+        """HTTP client and timeout settings for the OpenAI/Anthropic SDKs."""
+        import httpx
+        limits = httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize)
+        timeout = httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        hooks = {'request': [self._on_sdk_request], 'response': [self._on_sdk_response]}
+        return {'http_client': httpx.Client(limits=limits, timeout=timeout, event_hooks=hooks), 'timeout': timeout}
+
+    def _on_sdk_request(self, request):
+        self._sdk_local.request_started = time.monotonic()
+
+    def _on_sdk_response(self, response):
+        """Record status and time to first byte; runs once headers arrive, in the calling thread."""
+        call = getattr(self._sdk_local, 'call', None)
+        if call is not None:
+            call.http_status = response.status_code
+            call.ttfb = time.monotonic() - getattr(self._sdk_local, 'request_started', call.started)
+
+    @contextmanager
+    def _sdk_call(self, provider: str, model: str, request_bytes: int):
+        """Measure an SDK request, letting the httpx hooks fill in status and TTFB."""
+        with self.metrics.call(provider, model, request_bytes) as call:
+            self._sdk_local.call = call
+            try:
+                yield call
+            finally:
+                self._sdk_local.call = None
+
+    def close(self):
+        """Close pooled HTTP connections."""
+        self._executor.shutdown(wait=False)
+        self._refill_executor.shutdown(wait=False)
+        self.session.close()
+
     def _init_ai_client(self):
-        """Initialize AI client based on provider."""
-        try:
-            if self.ai_provider == 'openai':
-                import openai
-                self.openai_client = openai.OpenAI(
-                    api_key=os.getenv('OPENAI_API_KEY')
-                )
-            elif self.ai_provider == 'anthropic':
-                import anthropic
-                self.anthropic_client = anthropic.Anthropic(
-                    api_key=os.getenv('ANTHROPIC_API_KEY')
-                )
-            elif self.ai_provider == 'openrouter':
-                self.openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
-                self.openrouter_model = os.getenv('OPENROUTER_MODEL', 'anthropic/claude-3.5-sonnet')
-                if not self.openrouter_api_key:
-                    raise ValueError("OPENROUTER_API_KEY is required for OpenRouter provider")
-            logger.info(f"AI provider '{self.ai_provider}' initialized")
-        except Exception as e:
-            logger.warning(f"Failed to initialize AI provider: {e}. Using fallback comments.")
+        """Initialize AI clients for every provider in the chain."""
+        for provider in self.provider_chain:
+            try:
+                self._init_provider(provider)
+                self.providers.append(provider)
+                logger.info(f"AI provider '{provider}' initialized")
+            except Exception as e:
+                logger.warning(f"Failed to initialize AI provider '{provider}': {e}")
+
+        if not self.providers:
+            logger.warning("No AI provider available. Using fallback comments.")
             self.use_ai = False
+            return
+
+        self.ai_provider = self.providers[0]
+
+        if self.comment_mode == 'two_stage':
+            try:
+                if self.vision_provider not in ('openrouter', 'openai'):
+                    raise ValueError(f"VISION_PROVIDER must be 'openrouter' or 'openai', not '{self.vision_provider}'")
+                if self.vision_provider not in self.providers:
+                    self._init_provider(self.vision_provider)
+                default_vision_model = self.openrouter_model if self.vision_provider == 'openrouter' else 'gpt-4o-mini'
+                self.vision_model = os.getenv('VISION_MODEL', default_vision_model)
+                self.description_store = JsonStore(get_cache_dir() / 'descriptions.json')
+                logger.info(f"Two-stage comments enabled (vision: {self.vision_provider}/{self.vision_model})")
+            except Exception as e:
+                logger.warning(f"Two-stage comments unavailable, sending images directly: {e}")
+                self.comment_mode = 'direct'
+
+    def _init_provider(self, provider: str):
+        """Initialize the client for a single provider."""
+        if provider == 'openai':
+            import openai
+            self.openai_client = openai.OpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                **self._sdk_http_options()
+            )
+        elif provider == 'anthropic':
+            import anthropic
+            self.anthropic_client = anthropic.Anthropic(
+                api_key=os.getenv('ANTHROPIC_API_KEY'),
+                **self._sdk_http_options()
+            )
+        elif provider == 'openrouter':
+            self.openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
+            self.openrouter_model = os.getenv('OPENROUTER_MODEL', 'anthropic/claude-3.5-sonnet')
+            self.openrouter_text_model = os.getenv('OPENROUTER_TEXT_MODEL', self.openrouter_model)
+            if not self.openrouter_api_key:
+                raise ValueError("OPENROUTER_API_KEY is required for OpenRouter provider")
+        else:
+            raise ValueError(f"Unknown AI provider: {provider}")
 
     def generate_comment(self, image_path: Optional[Path] = None) -> str:
         """Generate a comment about Lain Iwakura.
@@ -71,147 +248,502 @@ class CommentGenerator:
             image_path: Optional path to the image for multimodal generation
         
         Returns:
-            Generated comment text
+            Generated comment; a CaptionBundle whose string value is the full
+            description and which also carries title, tweet and hashtag variants
         """
         if self.use_ai:
             try:
-                return self._generate_ai_comment(image_path)
+                for _ in range(self.dedupe_attempts):
+                    if image_path and self.comment_store:
+                        comment = self._generate_pooled_comment(image_path)
+                    else:
+                        comment = self._generate_ai_comments(image_path, 1)[1][0]
+
+                    if not self._is_repeat(comment):
+                        return comment
+                    logger.info(f"Rejected near-duplicate comment: {comment}")
+                logger.warning(f"No new comment after {self.dedupe_attempts} attempts")
+                self.metrics.record_fallback('duplicate')
             except Exception as e:
                 logger.error(f"Error generating AI comment: {e}")
-                logger.info("Falling back to predefined comments")
+                self.metrics.record_fallback('provider_error')
+            logger.info("Falling back to predefined comments")
         
         return self._generate_fallback_comment()
 
-    def _encode_image(self, image_path: Path) -> str:
-        """Encode image to base64 string.
-        
+    def _is_repeat(self, comment: str) -> bool:
+        """Check whether a comment is too similar to a recently posted one."""
+        return bool(self.caption_index) and self.caption_index.is_duplicate(comment)
+
+    def remember_posted(self, comment: str):
+        """Record a comment in the dedupe index once it has been posted.
+
+        Generated comments are not recorded, so one that failed to post can
+        be used again.
+        """
+        if self.caption_index:
+            try:
+                self.caption_index.add(comment)
+            except Exception as e:
+                logger.warning(f"Failed to record comment in dedupe index: {e}")
+
+    def _model_name(self, provider: Optional[str] = None) -> str:
+        """Return the model used by a provider (default: the primary provider)."""
+        provider = provider or self.ai_provider
+        if provider == 'openrouter':
+            return self.openrouter_text_model if self.comment_mode == 'two_stage' else self.openrouter_model
+        if provider == 'openai':
+            return os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+        if provider == 'anthropic':
+            return os.getenv('ANTHROPIC_MODEL', 'claude-3-haiku-20240307')
+        return provider
+
+    def pool_key(self, image_path: Path, provider: Optional[str] = None) -> str:
+        """Return the caption pool key for an image and the provider that wrote the captions.
+
         Args:
             image_path: Path to the image file
-            
+            provider: Provider whose model generated the captions (default: the primary provider)
+        """
+        version = f"{PROMPT_VERSION}-2s" if self.comment_mode == 'two_stage' else PROMPT_VERSION
+        return CommentStore.make_key(content_hash(image_path), version, self._model_name(provider))
+
+    def _pool_keys(self, image_path: Path) -> List[str]:
+        """Pool keys for every provider in the chain, primary first."""
+        return list(dict.fromkeys(self.pool_key(image_path, provider) for provider in self.providers or [None]))
+
+    def pool_available(self, image_path: Path) -> int:
+        """Return how many unused captions are pooled for an image, across providers."""
+        return sum(self.comment_store.available(key) for key in self._pool_keys(image_path))
+
+    def _take_pooled(self, image_path: Path) -> Optional[str]:
+        """Take a caption from the image's pools, preferring the primary provider's."""
+        for key in self._pool_keys(image_path):
+            comment = self.comment_store.take(key)
+            if comment:
+                return comment
+        return None
+
+    def _generate_pooled_comment(self, image_path: Path) -> str:
+        """Take an unused caption from the image's pool.
+
+        Only an empty pool is filled inline (waiting for a background refill
+        already in progress); otherwise the pool is topped up in the
+        background once it drops below COMMENT_POOL_LOW_WATER.
+
+        Args:
+            image_path: Path to the image file
+
         Returns:
-            Base64 encoded image string
+            Cached or freshly generated comment
         """
-        with open(image_path, 'rb') as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    
-    def _get_image_mime_type(self, image_path: Path) -> str:
-        """Get MIME type for image based on extension.
+        key = self.pool_key(image_path)
+        comment = self._take_pooled(image_path)
+        if comment:
+            logger.info(f"Using cached comment for {image_path.name}")
+        else:
+            with self._refill_lock:
+                refill = self._refills.get(key)
+            if refill:
+                refill.result()
+            else:
+                self.prefill(image_path)
+            comment = self._take_pooled(image_path)
+            if not comment:
+                raise ValueError("AI provider returned no usable comments")
+
+        self.ensure_pool(image_path)
+        return comment
+
+    def ensure_pool(self, image_path: Path) -> Optional[Future]:
+        """Start a background refill if the image's pool is below the low-water mark.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            The refill in progress, or None if the pool has enough captions
+        """
+        if not self.comment_store:
+            return None
+        key = self.pool_key(image_path)
+        with self._refill_lock:
+            if key in self._refills:
+                return self._refills[key]
+            if self.pool_available(image_path) >= max(1, self.pool_low_water):
+                return None
+
+            def refill():
+                try:
+                    self.prefill(image_path)
+                except Exception as e:
+                    logger.warning(f"Background caption refill for {image_path.name} failed: {e}")
+                finally:
+                    with self._refill_lock:
+                        self._refills.pop(key, None)
+
+            self._refills[key] = self._refill_executor.submit(refill)
+            return self._refills[key]
+
+    def prefill(self, image_path: Path, count: Optional[int] = None) -> int:
+        """Generate captions for an image and add them to its pool.
+
+        Args:
+            image_path: Path to the image file
+            count: Number of captions to request (default: COMMENT_POOL_SIZE)
+
+        Returns:
+            Number of captions added
+        """
+        count = count or self.pool_size
+        provider, comments = self._generate_ai_comments(image_path, count)
+        # Keyed by the provider that answered, which may be a fallback
+        self.comment_store.add(self.pool_key(image_path, provider), comments)
+        logger.info(f"Cached {len(comments)} {provider} comments for {image_path.name}")
+        return len(comments)
+
+    @staticmethod
+    def _parse_caption_bundles(text: str) -> List[CaptionBundle]:
+        """Parse caption bundles from model output.
+
+        Accepts a JSON object or a JSON array of objects. If the JSON is
+        invalid (e.g. a reply cut off at max_tokens), only the complete
+        objects are kept. Objects without a description are dropped.
+        """
+        match = re.search(r'[\[{].*[\]}]', text, re.DOTALL)
+        try:
+            data = json.loads(match.group(0)) if match else None
+            items = data if isinstance(data, list) else [data]
+        except ValueError:
+            # Salvage every complete object; a truncated one fails to decode
+            decoder = json.JSONDecoder()
+            items = []
+            pos = text.find('{')
+            while pos != -1:
+                try:
+                    item, end = decoder.raw_decode(text, pos)
+                    items.append(item)
+                    pos = text.find('{', end)
+                except ValueError:
+                    pos = text.find('{', pos + 1)
+
+        return [
+            CaptionBundle.from_dict(item) for item in items
+            if isinstance(item, dict) and isinstance(item.get('description'), str) and item['description'].strip()
+        ]
+
+    def _require_bundles(self, text: str) -> List[CaptionBundle]:
+        """Parse a provider reply, raising if it holds no usable caption."""
+        bundles = self._parse_caption_bundles(text)
+        if not bundles:
+            raise ValueError(f"reply had no usable captions: {text[:200]!r}")
+        return bundles
+
+    def _encode_image(self, image_path: Path) -> Tuple[str, str]:
+        """Downscale and encode an image for a multimodal request.
         
         Args:
             image_path: Path to the image file
             
         Returns:
-            MIME type string
-        """
-        extension = image_path.suffix.lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp'
-        }
-        return mime_types.get(extension, 'image/jpeg')
+            Tuple of (base64 encoded image, MIME type)
+        """
+        return self.vision_encoder.encode(image_path)
+
+    @staticmethod
+    def _format_instruction(count: int) -> str:
+        """Prompt text asking for caption bundle JSON (several posts if count > 1)."""
+        shape = ('{"title": "<headline under 80 characters>", '
+                 '"tweet": "<the post, under 280 characters, with its hashtags>", '
+                 '"description": "<a longer version of the post, 2-4 sentences>", '
+                 '"hashtags": ["#Lain", "..."]}')
+        if count <= 1:
+            return f"\nReturn only a JSON object of the form {shape}"
+        return (f"\nWrite {count} different posts. Return only a JSON array of {count} objects, "
+                f"each of the form {shape}")
+
+    def _generate_ai_comments(self, image_path: Optional[Path], count: int) -> Tuple[str, List[CaptionBundle]]:
+        """Generate one or more caption bundles with a single call to the AI provider chain.
+        
+        The reply is parsed inside the chain, so a provider whose reply holds
+        no usable caption fails over like one that errored.
+        
+        Args:
+            image_path: Optional path to the image for multimodal generation
+            count: Number of posts to request in one response
+        
+        Returns:
+            Tuple of (provider that answered, parsed caption bundles)
+        """
+        if self.comment_mode == 'two_stage' and image_path:
+            description = self.describe_image(image_path)
+            return self._run_provider_chain(
+                lambda provider: self._require_bundles(
+                    self._generate_provider_comment(provider, None, count, description))
+            )
+
+        return self._run_provider_chain(
+            lambda provider: self._require_bundles(self._generate_provider_comment(provider, image_path, count))
+        )
+
+    def _hedge_after(self, provider: str) -> float:
+        """Seconds to wait on a provider before hedging to the next one."""
+        observed = self.latency_tracker.percentile(provider, self.hedge_percentile)
+        delay = observed if observed is not None else self.hedge_delay
+        return min(delay, self.latency_budget)
+
+    def _ordered_providers(self) -> List[str]:
+        """Providers in chain order, with those whose latency percentile exceeds the budget last."""
+        def too_slow(provider: str) -> bool:
+            observed = self.latency_tracker.percentile(provider, self.hedge_percentile)
+            return observed is not None and observed >= self.latency_budget
+        return sorted(self.providers, key=too_slow)
+
+    def _run_provider_chain(self, call: Callable[[str], Any]) -> Tuple[str, Any]:
+        """Run call against each provider in order until one succeeds.
+
+        A provider that errors or exceeds AI_LATENCY_BUDGET is abandoned in
+        favour of the next one. With AI_HEDGE enabled, the next provider is
+        also started once the current one has been running longer than its
+        observed latency percentile; whichever answers first wins. Providers
+        that keep blowing the budget are tried after the others.
+
+        Budgets are measured from when a call starts running, not from when
+        it was queued, so a busy executor does not count against a provider.
+        Abandoned calls that have not started yet are cancelled.
+
+        Args:
+            call: Function performing the request for a given provider
+
+        Returns:
+            Tuple of (provider, first successful result)
+
+        Raises:
+            RuntimeError: If every provider failed or timed out
+        """
+        remaining = self._ordered_providers()
+        running = {}  # future -> (provider, start time list, empty until the call starts)
+        errors = []
+
+        def run(provider: str, started: List[float]):
+            started.append(time.monotonic())
+            return call(provider)
+
+        def launch():
+            provider = remaining.pop(0)
+            started: List[float] = []
+            running[self._executor.submit(run, provider, started)] = (provider, started)
+
+        def abandon(future: Future, provider: str, started: List[float]):
+            # Queued calls are dropped; running ones still count once they finish
+            if not future.cancel():
+                future.add_done_callback(
+                    lambda _: self.latency_tracker.record(provider, time.monotonic() - started[0])
+                )
+
+        launch()
+        while running:
+            now = time.monotonic()
+            # Poll while a call is still queued, since its deadline is not known yet
+            deadlines = [started[0] + self.latency_budget if started else now + 0.05
+                         for _, started in running.values()]
+            if self.hedge_enabled and remaining and len(running) == 1:
+                provider, started = next(iter(running.values()))
+                if started:
+                    deadlines.append(started[0] + self._hedge_after(provider))
+
+            done, _ = wait(running, timeout=max(0.0, min(deadlines) - now), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                provider, started = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"AI provider '{provider}' failed: {e}")
+                    errors.append(f"{provider}: {e}")
+                    continue
+                self.latency_tracker.record(provider, now - started[0])
+                # Providers overtaken by a hedge still count once they finish
+                for loser_future, (loser, loser_started) in running.items():
+                    abandon(loser_future, loser, loser_started)
+                return provider, result
+
+            for future, (provider, started) in list(running.items()):
+                if started and now - started[0] >= self.latency_budget:
+                    logger.warning(f"AI provider '{provider}' exceeded {self.latency_budget:.1f}s latency budget")
+                    errors.append(f"{provider}: timed out")
+                    self.latency_tracker.record(provider, now - started[0])
+                    del running[future]
 
-    def _generate_ai_comment(self, image_path: Optional[Path] = None) -> str:
-        """Generate comment using AI.
+            if remaining and not running:
+                launch()
+            elif self.hedge_enabled and remaining and len(running) == 1:
+                provider, started = next(iter(running.values()))
+                if started and now - started[0] >= self._hedge_after(provider):
+                    logger.info(f"AI provider '{provider}' is slow, hedging with '{remaining[0]}'")
+                    launch()
+
+        raise RuntimeError(f"All AI providers failed ({'; '.join(errors)})")
+
+    def _generate_provider_comment(self, provider: str, image_path: Optional[Path] = None, count: int = 1,
+                                   description: Optional[dict] = None) -> str:
+        """Generate comment with a single provider.
         
         Args:
+            provider: Provider name (openrouter, openai or anthropic)
             image_path: Optional path to the image for multimodal generation
+            count: Number of posts to request in one response
+            description: Cached image description for text-only generation
         
         Returns:
             AI-generated comment
         """
-        if self.ai_provider == 'openrouter' and image_path:
-            return self._generate_openrouter_comment(image_path)
+        if provider == 'openrouter' and image_path and not description:
+            return self._generate_openrouter_comment(image_path, count)
         
-        # Fallback to text-only for other providers
-        prompt = """Generate a short, engaging social media post (under 280 characters) about Lain Iwakura from Serial Experiments Lain. 
+        if description:
+            # Two-stage mode: condition a cheap text-only call on the cached description
+            prompt = """Generate a short, engaging social media post (under 280 characters) about an image of Lain Iwakura from Serial Experiments Lain.
+This is a description of the image:
+""" + json.dumps(description, ensure_ascii=False) + """
+The post should be thoughtful, slightly mysterious, and relate to what the image shows as well as themes of technology, consciousness, or the internet.
+Include 1-2 relevant hashtags. Use emojis sparingly but effectively.""" + self._format_instruction(count)
+        else:
+            # Text-only prompt for other providers
+            prompt = """Generate a short, engaging social media post (under 280 characters) about Lain Iwakura from Serial Experiments Lain. 
 The post should be thoughtful, slightly mysterious, and relate to themes of technology, consciousness, or the internet.
-Include 1-2 relevant hashtags. Use emojis sparingly but effectively."""
+Include 1-2 relevant hashtags. Use emojis sparingly but effectively.""" + self._format_instruction(count)
 
-        if self.ai_provider == 'openai':
-            response = self.openai_client.chat.completions.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
-                messages=[
+        if provider == 'openrouter':
+            return self._openrouter_chat(self.openrouter_text_model, prompt, max_tokens=300 * count)
+
+        if provider == 'openai':
+            return self._openai_chat(
+                os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
+                [
                     {"role": "system", "content": "You are a creative social media manager who loves Serial Experiments Lain."},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=100,
-                temperature=0.9
-            )
-            return response.choices[0].message.content.strip()
-        
-        elif self.ai_provider == 'anthropic':
-            response = self.anthropic_client.messages.create(
-                model=os.getenv('ANTHROPIC_MODEL', 'claude-3-haiku-20240307'),
-                max_tokens=100,
-                temperature=0.9,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+                max_tokens=300 * count
             )
+        
+        elif provider == 'anthropic':
+            model = os.getenv('ANTHROPIC_MODEL', 'claude-3-haiku-20240307')
+            messages = [{"role": "user", "content": prompt}]
+            with self._sdk_call('anthropic', model, len(json.dumps(messages).encode('utf-8'))) as call:
+                response = self.anthropic_client.messages.create(
+                    model=model,
+                    max_tokens=300 * count,
+                    temperature=0.9,
+                    messages=messages
+                )
+                call.prompt_tokens = response.usage.input_tokens
+                call.completion_tokens = response.usage.output_tokens
             return response.content[0].text.strip()
         
-        return self._generate_fallback_comment()
+        raise ValueError(f"Unknown AI provider: {provider}")
+
+    def _openai_chat(self, model: str, messages: list, max_tokens: int, temperature: float = 0.9) -> str:
+        """Send a chat completion request through the OpenAI SDK.
+        
+        Args:
+            model: OpenAI model name
+            messages: Chat messages
+            max_tokens: Completion token limit
+            temperature: Sampling temperature
+            
+        Returns:
+            The completion text
+        """
+        with self._sdk_call('openai', model, len(json.dumps(messages).encode('utf-8'))) as call:
+            response = self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            if response.usage:
+                call.prompt_tokens = response.usage.prompt_tokens
+                call.completion_tokens = response.usage.completion_tokens
+        return response.choices[0].message.content.strip()
+
+    def _openrouter_chat(self, model: str, content, max_tokens: int, temperature: float = 0.9) -> str:
+        """Send a single-message chat completion request to OpenRouter.
+        
+        Args:
+            model: OpenRouter model identifier
+            content: Message content (a string or a list of content parts)
+            max_tokens: Completion token limit
+            temperature: Sampling temperature
+            
+        Returns:
+            The completion text
+        """
+        headers = {
+            "Authorization": f"Bearer {self.openrouter_api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            # Ask OpenRouter to report token usage and cost in the response
+            "usage": {"include": True}
+        }
+        body = json.dumps(payload).encode('utf-8')
+        
+        with self.metrics.call('openrouter', model, len(body)) as call:
+            response = self.session.post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                headers=headers,
+                data=body,
+                timeout=self.timeout
+            )
+            call.http_status = response.status_code
+            call.ttfb = response.elapsed.total_seconds()
+            response.raise_for_status()
+            
+            result = response.json()
+            usage = result.get('usage') or {}
+            call.prompt_tokens = usage.get('prompt_tokens')
+            call.completion_tokens = usage.get('completion_tokens')
+            call.cost = usage.get('cost')
+        return result['choices'][0]['message']['content'].strip()
     
-    def _generate_openrouter_comment(self, image_path: Path) -> str:
+    def _generate_openrouter_comment(self, image_path: Path, count: int = 1) -> str:
         """Generate comment using OpenRouter API with image input.
         
         Args:
             image_path: Path to the image file
+            count: Number of posts to request in one response
             
         Returns:
             AI-generated comment based on the image
         """
         try:
-            # Encode image to base64
-            image_base64 = self._encode_image(image_path)
-            mime_type = self._get_image_mime_type(image_path)
-            
-            # Prepare the multimodal request
-            headers = {
-                "Authorization": f"Bearer {self.openrouter_api_key}",
-                "Content-Type": "application/json"
-            }
+            # Downscale and encode image to base64
+            image_base64, mime_type = self._encode_image(image_path)
             
             prompt = """Analyze this image of Lain Iwakura from Serial Experiments Lain and generate a short, engaging social media post (under 280 characters).
 The post should be thoughtful, slightly mysterious, and relate to what you see in the image as well as themes of technology, consciousness, or the internet.
-Include 1-2 relevant hashtags. Use emojis sparingly but effectively."""
+Include 1-2 relevant hashtags. Use emojis sparingly but effectively.""" + self._format_instruction(count)
             
-            payload = {
-                "model": self.openrouter_model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:{mime_type};base64,{image_base64}"
-                                }
-                            }
-                        ]
+            content = [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime_type};base64,{image_base64}"
                     }
-                ],
-                "max_tokens": 150,
-                "temperature": 0.9
-            }
-            
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
+                }
+            ]
             
-            result = response.json()
-            comment = result['choices'][0]['message']['content'].strip()
+            comment = self._openrouter_chat(self.openrouter_model, content, max_tokens=350 * count)
             logger.info(f"Generated OpenRouter comment with image: {comment}")
             return comment
             
@@ -219,10 +751,58 @@ Include 1-2 relevant hashtags. Use emojis sparingly but effectively."""
             logger.error(f"Error generating OpenRouter comment: {e}")
             raise
 
+    def describe_image(self, image_path: Path) -> dict:
+        """Return a structured description of an image, using the cache if possible.
+        
+        The image is described once by VISION_MODEL; later calls for the same
+        image content reuse the cached description.
+        
+        Args:
+            image_path: Path to the image file
+            
+        Returns:
+            Description dict (subjects, setting, mood, colors, details)
+        """
+        key = f"{content_hash(image_path)}:{DESCRIBE_PROMPT_VERSION}:{self.vision_provider}:{self.vision_model}"
+        description = self.description_store.get(key)
+        if description:
+            return description
+
+        image_base64, mime_type = self._encode_image(image_path)
+        prompt = """Describe this image of Lain Iwakura from Serial Experiments Lain for a copywriter who cannot see it.
+Return only a JSON object with the keys "subjects", "setting", "mood", "colors" (a list), "details" (a list of notable visual details) and "text" (any visible text, or an empty string)."""
+        content = [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}}
+        ]
+
+        if self.vision_provider == 'openai':
+            raw = self._openai_chat(self.vision_model, [{"role": "user", "content": content}], max_tokens=400, temperature=0.2)
+        else:
+            raw = self._openrouter_chat(self.vision_model, content, max_tokens=400, temperature=0.2)
+
+        match = re.search(r'\{.*\}', raw, re.DOTALL)
+        try:
+            description = json.loads(match.group(0)) if match else {'summary': raw}
+        except ValueError:
+            description = {'summary': raw}
+
+        self.description_store.set(key, description)
+        logger.info(f"Cached vision description for {image_path.name}")
+        return description
+
     def _generate_fallback_comment(self) -> str:
         """Generate a comment from predefined list.
         
         Returns:
-            Random predefined comment
+            Random predefined comment, avoiding recently posted ones when possible
         """
-        return random.choice(self.fallback_comments)
+        candidates = random.sample(self.fallback_comments, len(self.fallback_comments))
+        if self.caption_index:
+            fresh = [c for c in candidates if not self.caption_index.is_duplicate(c)]
+            if fresh:
+                candidates = fresh
+            else:
+                # All used recently: pick the one least similar to past posts
+                candidates.sort(key=self.caption_index.similarity)
+        return CaptionBundle.from_text(candidates[0])
@@ -0,0 +1,238 @@
+"""Accounting for AI provider calls: tokens, bytes, latency and cost.
+
+Every request is appended as one JSON line to the ledger file
+(AI_LEDGER_PATH, default CACHE_DIR/ai_ledger.jsonl) and aggregated in memory
+per provider and model. Aggregates are available in Prometheus text format,
+served on METRICS_PORT when the bot starts a metrics server.
+
+Costs come from the provider when it reports them (OpenRouter usage
+accounting) or from AI_MODEL_PRICES, a JSON object mapping model names to
+[prompt, completion] USD prices per million tokens.
+
+Run `python ai_metrics.py` to summarize the ledger per provider and model.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from content_cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+def _ledger_path() -> Path:
+    path = os.getenv('AI_LEDGER_PATH')
+    return Path(path) if path else get_cache_dir() / 'ai_ledger.jsonl'
+
+
+def _load_prices() -> Dict[str, Tuple[float, float]]:
+    try:
+        return {k: (float(v[0]), float(v[1])) for k, v in json.loads(os.getenv('AI_MODEL_PRICES', '{}')).items()}
+    except Exception as e:
+        logger.warning(f"Ignoring invalid AI_MODEL_PRICES: {e}")
+        return {}
+
+
+class AICall:
+    """Measurements for one provider request, filled in by the caller."""
+
+    def __init__(self, provider: str, model: str, request_bytes: int = 0,
+                 metrics: Optional['AIMetrics'] = None):
+        self._metrics = metrics
+        self.provider = provider
+        self.model = model
+        self.request_bytes = request_bytes
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.ttfb: Optional[float] = None
+        self.http_status: Optional[int] = None
+        self.status = 'ok'
+        self.cost: Optional[float] = None
+        self.error: Optional[str] = None
+        self.started = time.monotonic()
+
+    def __enter__(self) -> 'AICall':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error = str(exc)
+            # SDK errors (openai/anthropic APIStatusError) carry the HTTP status
+            if getattr(exc, 'status_code', None):
+                self.http_status = exc.status_code
+            self.status = str(self.http_status) if self.http_status and self.http_status >= 400 else 'error'
+        self.latency = time.monotonic() - self.started
+        if self._metrics:
+            self._metrics.record(self)
+        return False
+
+
+class AIMetrics:
+    """Ledger writer and per provider/model aggregates."""
+
+    def __init__(self):
+        self.enabled = os.getenv('AI_LEDGER', 'true').lower() == 'true'
+        self.path = _ledger_path()
+        self.prices = _load_prices()
+        self._lock = threading.Lock()
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._statuses: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._fallbacks: Dict[str, int] = defaultdict(int)
+
+    def call(self, provider: str, model: str, request_bytes: int = 0) -> AICall:
+        """Start measuring a request; use as a context manager."""
+        return AICall(provider, model, request_bytes, metrics=self)
+
+    def _estimate_cost(self, call: AICall) -> Optional[float]:
+        price = self.prices.get(call.model)
+        if not price or call.prompt_tokens is None:
+            return None
+        return (call.prompt_tokens * price[0] + (call.completion_tokens or 0) * price[1]) / 1_000_000
+
+    def record(self, call: AICall):
+        """Aggregate a finished call and append it to the ledger."""
+        if call.cost is None:
+            call.cost = self._estimate_cost(call)
+        status = call.status
+
+        with self._lock:
+            totals = self._totals[(call.provider, call.model)]
+            totals['calls'] += 1
+            totals['prompt_tokens'] += call.prompt_tokens or 0
+            totals['completion_tokens'] += call.completion_tokens or 0
+            totals['request_bytes'] += call.request_bytes
+            totals['latency_seconds'] += call.latency
+            if call.ttfb is not None:
+                totals['ttfb_seconds'] += call.ttfb
+                totals['ttfb_count'] += 1
+            totals['cost_usd'] += call.cost or 0
+            self._statuses[(call.provider, call.model, status)] += 1
+
+        self._write({
+            'ts': time.time(),
+            'provider': call.provider,
+            'model': call.model,
+            'status': status,
+            'http_status': call.http_status,
+            'prompt_tokens': call.prompt_tokens,
+            'completion_tokens': call.completion_tokens,
+            'request_bytes': call.request_bytes,
+            'ttfb': round(call.ttfb, 4) if call.ttfb is not None else None,
+            'latency': round(call.latency, 4),
+            'cost_usd': call.cost,
+            'error': call.error,
+        })
+
+    def record_fallback(self, reason: str):
+        """Record that a post used a predefined comment instead of AI output."""
+        with self._lock:
+            self._fallbacks[reason] += 1
+        self._write({'ts': time.time(), 'provider': 'fallback', 'status': 'fallback', 'fallback_reason': reason})
+
+    def _write(self, entry: dict):
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.warning(f"Failed to write AI ledger: {e}")
+
+    def prometheus_text(self) -> str:
+        """Return aggregates in Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for (provider, model, status), count in sorted(self._statuses.items()):
+                lines.append(f'lain_ai_calls_total{{provider="{provider}",model="{model}",status="{status}"}} {count}')
+            for (provider, model), totals in sorted(self._totals.items()):
+                labels = f'provider="{provider}",model="{model}"'
+                lines.append(f'lain_ai_tokens_total{{{labels},type="prompt"}} {totals["prompt_tokens"]:g}')
+                lines.append(f'lain_ai_tokens_total{{{labels},type="completion"}} {totals["completion_tokens"]:g}')
+                lines.append(f'lain_ai_request_bytes_total{{{labels}}} {totals["request_bytes"]:g}')
+                lines.append(f'lain_ai_latency_seconds_sum{{{labels}}} {totals["latency_seconds"]:.4f}')
+                lines.append(f'lain_ai_latency_seconds_count{{{labels}}} {totals["calls"]:g}')
+                lines.append(f'lain_ai_ttfb_seconds_sum{{{labels}}} {totals["ttfb_seconds"]:.4f}')
+                lines.append(f'lain_ai_ttfb_seconds_count{{{labels}}} {totals["ttfb_count"]:g}')
+                lines.append(f'lain_ai_cost_usd_total{{{labels}}} {totals["cost_usd"]:.6f}')
+            for reason, count in sorted(self._fallbacks.items()):
+                lines.append(f'lain_ai_fallbacks_total{{reason="{reason}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+_metrics: Optional[AIMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_ai_metrics() -> AIMetrics:
+    """Return the process-wide AI metrics instance."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = AIMetrics()
+        return _metrics
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve AI metrics at /metrics from a daemon thread."""
+    metrics = get_ai_metrics()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-server').start()
+    logger.info(f"Metrics server listening on {host}:{port}/metrics")
+    return server
+
+
+def summarize_ledger(path: Path) -> Dict[Tuple[str, str], Dict[str, float]]:
+    """Aggregate a ledger file per provider and model."""
+    summary: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            row = summary[(entry.get('provider'), entry.get('model') or entry.get('fallback_reason') or '-')]
+            row['calls'] += 1
+            row['errors'] += entry.get('status') not in ('ok', 'fallback')
+            row['latency'] += entry.get('latency') or 0
+            row['tokens'] += (entry.get('prompt_tokens') or 0) + (entry.get('completion_tokens') or 0)
+            row['cost'] += entry.get('cost_usd') or 0
+    return summary
+
+
+if __name__ == '__main__':
+    ledger = Path(sys.argv[1]) if len(sys.argv) > 1 else _ledger_path()
+    if not ledger.exists():
+        print(f"Ledger not found: {ledger}")
+        raise SystemExit(1)
+
+    print(f"{'provider':<12} {'model':<40} {'calls':>6} {'errors':>6} {'avg s':>7} {'avg tok':>8} {'cost $':>9}")
+    for (provider, model), row in sorted(summarize_ledger(ledger).items()):
+        calls = row['calls'] or 1
+        print(f"{provider:<12} {model:<40} {row['calls']:>6.0f} {row['errors']:>6.0f} "
+              f"{row['latency'] / calls:>7.2f} {row['tokens'] / calls:>8.0f} {row['cost']:>9.4f}")
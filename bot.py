@@ -29,6 +29,7 @@ from social_platforms.signal import SignalPoster
 from social_platforms.instagram import InstagramPoster
 from social_platforms.youtube import YouTubePoster
 from ai_comment_generator import CommentGenerator
+from ai_metrics import start_metrics_server
 from image_manager import ImageManager
 
 # Configure logging
@@ -67,7 +68,7 @@ class LainSocialBot:
                 logger.error(f"Failed to initialize Reddit poster: {e}")
 
         # Discord (via webhook)
-        if os.getenv('DISCORD_WEBHOOK_URL'):
+        if os.getenv('DISCORD_WEBHOOK_URL') or os.getenv('DISCORD_WEBHOOKS_FILE'):
             try:
                 self.posters.append(DiscordPoster())
                 logger.info("Discord poster initialized")
@@ -75,39 +76,39 @@ class LainSocialBot:
                 logger.error(f"Failed to initialize Discord poster: {e}")
 
         # Telegram (via bot token)
-        if os.getenv('TELEGRAM_BOT_TOKEN') and os.getenv('TELEGRAM_CHAT_ID'):
+        if os.getenv('TELEGRAM_BOT_TOKEN') and (os.getenv('TELEGRAM_CHAT_ID') or os.getenv('TELEGRAM_CHAT_IDS_FILE')):
             try:
                 self.posters.append(TelegramPoster())
                 logger.info("Telegram poster initialized")
             except Exception as e:
                 logger.error(f"Failed to initialize Telegram poster: {e}")
 
-            # Facebook Page photo upload
-            if os.getenv('FB_PAGE_ID') and os.getenv('FB_PAGE_ACCESS_TOKEN'):
-                try:
-                    self.posters.append(FacebookPoster())
-                    logger.info("Facebook poster initialized")
-                except Exception as e:
-                    logger.error(f"Failed to initialize Facebook poster: {e}")
+        # Facebook Page photo upload
+        if (os.getenv('FB_PAGE_ID') and os.getenv('FB_PAGE_ACCESS_TOKEN')) or os.getenv('FB_PAGES') or os.getenv('FB_PAGES_FILE'):
+            try:
+                self.posters.append(FacebookPoster())
+                logger.info("Facebook poster initialized")
+            except Exception as e:
+                logger.error(f"Failed to initialize Facebook poster: {e}")
 
-            # LinkedIn (UGC image posting)
-            if os.getenv('LINKEDIN_ACCESS_TOKEN') and os.getenv('LINKEDIN_OWNER_URN'):
-                try:
-                    self.posters.append(LinkedInPoster())
-                    logger.info("LinkedIn poster initialized")
-                except Exception as e:
-                    logger.error(f"Failed to initialize LinkedIn poster: {e}")
+        # LinkedIn (UGC image posting)
+        if os.getenv('LINKEDIN_ACCESS_TOKEN') and os.getenv('LINKEDIN_OWNER_URN'):
+            try:
+                self.posters.append(LinkedInPoster())
+                logger.info("LinkedIn poster initialized")
+            except Exception as e:
+                logger.error(f"Failed to initialize LinkedIn poster: {e}")
 
-            # WhatsApp (Cloud API)
-            if os.getenv('WHATSAPP_PHONE_NUMBER_ID') and os.getenv('WHATSAPP_ACCESS_TOKEN') and os.getenv('WHATSAPP_TO'):
-                try:
-                    self.posters.append(WhatsAppPoster())
-                    logger.info("WhatsApp poster initialized")
-                except Exception as e:
-                    logger.error(f"Failed to initialize WhatsApp poster: {e}")
+        # WhatsApp (Cloud API)
+        if os.getenv('WHATSAPP_PHONE_NUMBER_ID') and os.getenv('WHATSAPP_ACCESS_TOKEN') and (os.getenv('WHATSAPP_TO') or os.getenv('WHATSAPP_TO_FILE')):
+            try:
+                self.posters.append(WhatsAppPoster())
+                logger.info("WhatsApp poster initialized")
+            except Exception as e:
+                logger.error(f"Failed to initialize WhatsApp poster: {e}")
 
         # Signal via signal-cli REST API
-        if os.getenv('SIGNAL_RECIPIENT'):
+        if os.getenv('SIGNAL_RECIPIENT') or os.getenv('SIGNAL_GROUP_IDS'):
             try:
                 self.posters.append(SignalPoster())
                 logger.info("Signal poster initialized")
@@ -115,7 +116,7 @@ class LainSocialBot:
                 logger.error(f"Failed to initialize Signal poster: {e}")
 
         # Instagram (Graph API with media hosting)
-        if os.getenv('INSTAGRAM_BUSINESS_ACCOUNT_ID') and os.getenv('FB_PAGE_ACCESS_TOKEN'):
+        if (os.getenv('INSTAGRAM_BUSINESS_ACCOUNT_ID') and os.getenv('FB_PAGE_ACCESS_TOKEN')) or os.getenv('INSTAGRAM_ACCOUNTS'):
             try:
                 self.posters.append(InstagramPoster())
                 logger.info("Instagram poster initialized")
@@ -147,24 +148,38 @@ class LainSocialBot:
         # Configuration
         self.post_interval = int(os.getenv('POST_INTERVAL_HOURS', '6'))
         self.simultaneous_post = os.getenv('SIMULTANEOUS_POST', 'true').lower() == 'true'
+        # Images per post; platforms without album support post the first one
+        self.album_size = max(1, int(os.getenv('ALBUM_SIZE', '1')))
+        # Images chosen ahead of time so posters can prepare them (e.g. render videos)
+        self._next_images: Optional[List[Path]] = None
+
+        # Optional Prometheus endpoint for AI call metrics
+        metrics_port = os.getenv('METRICS_PORT')
+        if metrics_port:
+            try:
+                start_metrics_server(int(metrics_port))
+            except Exception as e:
+                logger.error(f"Failed to start metrics server: {e}")
 
-    def generate_post(self) -> tuple[Optional[Path], Optional[str]]:
-        """Generate a post with image and comment.
+    def generate_post(self) -> tuple[Optional[List[Path]], Optional[str]]:
+        """Generate a post with one or more images (ALBUM_SIZE) and a comment.
         
         Returns:
-            Tuple of (image_path, comment_text)
+            Tuple of (image_paths, comment_text)
         """
         try:
-            image_path = self.image_manager.get_random_image()
-            if not image_path:
+            image_paths, self._next_images = self._next_images, None
+            if not image_paths or not all(p.exists() for p in image_paths):
+                image_paths = self.image_manager.get_random_images(self.album_size)
+            if not image_paths:
                 logger.error("No image available")
                 return None, None
             
-            # Pass image path to comment generator for multimodal AI
-            comment = self.comment_generator.generate_comment(image_path)
+            # Pass the lead image to comment generator for multimodal AI
+            comment = self.comment_generator.generate_comment(image_paths[0])
             logger.info(f"Generated comment: {comment}")
             
-            return image_path, comment
+            return image_paths, comment
         except Exception as e:
             logger.error(f"Error generating post: {e}")
             return None, None
@@ -173,8 +188,8 @@ class LainSocialBot:
         """Post to all configured social media platforms."""
         logger.info("Starting post cycle...")
         
-        image_path, comment = self.generate_post()
-        if not image_path or not comment:
+        image_paths, comment = self.generate_post()
+        if not image_paths or not comment:
             logger.error("Failed to generate post content")
             return
         
@@ -184,9 +199,16 @@ class LainSocialBot:
         for poster in self.posters:
             try:
                 logger.info(f"Posting to {poster.platform_name}...")
-                poster.post(image_path, comment)
-                successful_posts += 1
-                logger.info(f"Successfully posted to {poster.platform_name}")
+                if len(image_paths) > 1 and hasattr(poster, 'post_album'):
+                    posted = poster.post_album(image_paths, comment)
+                else:
+                    posted = poster.post(image_paths[0], comment)
+                if posted is False:
+                    failed_posts += 1
+                    logger.error(f"Failed to post to {poster.platform_name}")
+                else:
+                    successful_posts += 1
+                    logger.info(f"Successfully posted to {poster.platform_name}")
                 
                 # Add delay between platforms if not posting simultaneously
                 if not self.simultaneous_post and poster != self.posters[-1]:
@@ -197,16 +219,43 @@ class LainSocialBot:
                 logger.error(f"Failed to post to {poster.platform_name}: {e}")
         
         logger.info(f"Post cycle complete. Success: {successful_posts}, Failed: {failed_posts}")
+        
+        # Only captions that actually went out count as used for dedupe
+        if successful_posts:
+            self.comment_generator.remember_posted(comment)
+
+    def prefetch_next_post(self):
+        """Pick the next post's images and let posters prepare them in the background."""
+        self._next_images = self.image_manager.get_random_images(self.album_size)
+        if not self._next_images:
+            return
+        
+        # Top up the next image's caption pool while waiting for the schedule
+        try:
+            self.comment_generator.ensure_pool(self._next_images[0])
+        except Exception as e:
+            logger.warning(f"Failed to prepare captions for next post: {e}")
+        
+        for poster in self.posters:
+            if hasattr(poster, 'prepare'):
+                try:
+                    poster.prepare(self._next_images[0])
+                except Exception as e:
+                    logger.warning(f"Failed to prepare next post for {poster.platform_name}: {e}")
+
+    def _scheduled_cycle(self):
+        self.post_to_all_platforms()
+        self.prefetch_next_post()
 
     def run_scheduled(self):
         """Run the bot on a schedule."""
         logger.info(f"Bot starting with {self.post_interval} hour interval")
         
         # Post immediately on startup
-        self.post_to_all_platforms()
+        self._scheduled_cycle()
         
         # Schedule regular posts
-        schedule.every(self.post_interval).hours.do(self.post_to_all_platforms)
+        schedule.every(self.post_interval).hours.do(self._scheduled_cycle)
         
         while True:
             schedule.run_pending()
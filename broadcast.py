@@ -0,0 +1,60 @@
+"""Helpers for posters that deliver one post to many recipients."""
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def load_targets(env_var: str, file_env_var: str) -> List[str]:
+    """Read recipients from a comma-separated variable and a one-per-line file.
+
+    Blank lines and lines starting with '#' in the file are skipped, and
+    duplicates are dropped while keeping the first occurrence's order.
+    """
+    targets = [t.strip() for t in os.getenv(env_var, '').split(',') if t.strip()]
+    targets_file = os.getenv(file_env_var)
+    if targets_file:
+        with open(targets_file, 'r', encoding='utf-8') as f:
+            targets.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return list(dict.fromkeys(targets))
+
+
+def broadcast(targets: List[str], send: Callable[[str], bool], concurrency: int, label: str,
+              first: Optional[Callable[[str], bool]] = None) -> int:
+    """Deliver to every target, uploading once before fanning out.
+
+    Targets are tried in order with `first` (default: `send`) until one
+    succeeds, which is where media gets uploaded and its id or URL remembered.
+    The remaining targets are then sent to concurrently with `send`.
+
+    Args:
+        targets: Recipients in priority order
+        send: Sends to one target, returning True on success
+        concurrency: Maximum sends in flight during the fan-out
+        label: Recipient description used in error logs, e.g. "Telegram chat"
+        first: Sends to a target before any send has succeeded
+
+    Returns:
+        Number of targets that received the post
+    """
+    first = first or send
+
+    def send_safe(fn: Callable[[str], bool], target: str) -> bool:
+        try:
+            return bool(fn(target))
+        except Exception as e:
+            logger.error(f"Error posting to {label}: {e}")
+            return False
+
+    remaining = list(targets)
+    succeeded = 0
+    while remaining and not succeeded:
+        succeeded += send_safe(first, remaining.pop(0))
+
+    if succeeded and remaining:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(remaining)))) as executor:
+            succeeded += sum(executor.map(lambda target: send_safe(send, target), remaining))
+    return succeeded
@@ -0,0 +1,261 @@
+"""MinHash index of posted captions for near-duplicate suppression.
+
+Captions are normalized (lower case, hashtags and punctuation removed) and
+split into character shingles. Each caption gets:
+
+- a MinHash signature (one-permutation hashing, so each shingle is hashed
+  once), bucketed with locality-sensitive hashing (LSH) bands. A lookup only
+  considers the past captions that share a band instead of scanning the
+  whole history.
+- a shingle fingerprint: a FINGERPRINT_BITS-bit set of shingle hashes. LSH
+  candidates are verified with the Jaccard similarity of their fingerprints.
+  This is exact up to rare bit collisions, so the threshold is not subject
+  to MinHash estimation noise.
+
+Band keys (blake2b digests, so the file format does not depend on the
+interpreter) and fingerprints are appended to a binary file
+(CACHE_DIR/captions-v3.idx); entries older than CAPTION_DEDUPE_WINDOW_DAYS
+are dropped when it is loaded. Only timestamps, bit counts and the LSH
+buckets are kept in memory. Fingerprints stay in the memory-mapped file and
+are read only to verify a candidate.
+"""
+
+import os
+import re
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from content_cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+FINGERPRINT_BITS = 4096
+
+# Six-row bands: a pair with Jaccard similarity 0.78 shares a band with
+# probability ~0.99 (0.7: ~0.92), unrelated captions (0.2) ~0.001
+_RECORD = struct.Struct(f'<d{BANDS}q{FINGERPRINT_BITS // 8}s')
+_FINGERPRINT_OFFSET = _RECORD.size - FINGERPRINT_BITS // 8
+_BAND = struct.Struct(f'<B{ROWS}I')
+_HASHTAG_RE = re.compile(r'#\w+')
+_NON_WORD_RE = re.compile(r'[^\w]+')
+
+
+def normalize(text: str) -> str:
+    """Lower-case text and strip hashtags, emoji and punctuation."""
+    text = _HASHTAG_RE.sub(' ', text.lower())
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+
+def _shingle_hashes(text: str) -> List[int]:
+    norm = normalize(text)
+    if len(norm) <= SHINGLE_SIZE:
+        shingles = {norm}
+    else:
+        shingles = {norm[i:i + SHINGLE_SIZE] for i in range(len(norm) - SHINGLE_SIZE + 1)}
+    return [
+        int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little')
+        for s in shingles
+    ]
+
+
+def signature(hashes: List[int]) -> Tuple[int, ...]:
+    """Return the MinHash signature of a caption's shingle hashes.
+
+    Each shingle hash picks a bin from its low bits and competes for that
+    bin's minimum with the remaining bits; empty bins borrow the value of
+    the next non-empty bin (rotation densification).
+    """
+    bins: List[Optional[int]] = [None] * NUM_PERM
+    for h in hashes:
+        slot, value = h % NUM_PERM, h // NUM_PERM
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+
+    filled = [i for i, value in enumerate(bins) if value is not None]
+    sig = []
+    for i, value in enumerate(bins):
+        if value is None:
+            # Nearest filled bin to the right, wrapping around
+            j = next((f for f in filled if f > i), filled[0])
+            value = bins[j] + (j - i) % NUM_PERM
+        sig.append(value & 0xFFFFFFFF)
+    return tuple(sig)
+
+
+def fingerprint(hashes: List[int]) -> int:
+    """Return a caption's shingle set as a FINGERPRINT_BITS-bit integer."""
+    bits = 0
+    for h in hashes:
+        bits |= 1 << (h % FINGERPRINT_BITS)
+    return bits
+
+
+def jaccard(a: int, b: int) -> float:
+    """Jaccard similarity of two fingerprints."""
+    union = (a | b).bit_count()
+    return (a & b).bit_count() / union if union else 1.0
+
+
+def _jaccard_counted(a: int, a_count: int, b: int, b_count: int) -> float:
+    """jaccard() with both fingerprints' bit counts already known."""
+    common = (a & b).bit_count()
+    union = a_count + b_count - common
+    return common / union if union else 1.0
+
+
+def _band_keys(sig: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(
+        int.from_bytes(
+            hashlib.blake2b(_BAND.pack(band, *sig[band * ROWS:(band + 1) * ROWS]), digest_size=8).digest(),
+            'little', signed=True
+        )
+        for band in range(BANDS)
+    )
+
+
+def sketch(text: str) -> Tuple[Tuple[int, ...], int]:
+    """Return the LSH band keys and fingerprint of a caption."""
+    hashes = _shingle_hashes(text)
+    return _band_keys(signature(hashes)), fingerprint(hashes)
+
+
+class CaptionIndex:
+    """Remembers posted captions and detects near-duplicates."""
+
+    def __init__(self, path: Optional[Path] = None):
+        default_path = get_cache_dir() / 'captions-v3.idx'
+        self.path = Path(path) if path else default_path
+        self.threshold = float(os.getenv('CAPTION_SIMILARITY_THRESHOLD', '0.7'))
+        self.window = float(os.getenv('CAPTION_DEDUPE_WINDOW_DAYS', '180')) * 86400
+
+        if not path:
+            # Band keys of older files came from hash() and cannot be reused
+            default_path.with_name('captions-v2.idx').unlink(missing_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        with self._lock:
+            self._load()
+
+    def _index(self, timestamp: float, keys: Tuple[int, ...], bit_count: int):
+        entry_id = len(self._timestamps)
+        self._timestamps.append(timestamp)
+        self._bit_counts.append(bit_count)
+        # Most band keys are unique, so a bucket holds a bare entry id until it is shared
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = entry_id
+            elif isinstance(bucket, int):
+                self._buckets[key] = [bucket, entry_id]
+            else:
+                bucket.append(entry_id)
+
+    @staticmethod
+    def _pack(timestamp: float, keys: Tuple[int, ...], bits: int) -> bytes:
+        return _RECORD.pack(timestamp, *keys, bits.to_bytes(FINGERPRINT_BITS // 8, 'little'))
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _load(self):
+        """Build the index from the file, dropping expired and partial records."""
+        self._close()
+        self._timestamps = array('d')
+        self._bit_counts = array('H')
+        self._buckets: Dict[int, Union[int, List[int]]] = {}
+
+        data = memoryview(self.path.read_bytes() if self.path.exists() else b'')
+        cutoff = time.time() - self.window
+        kept = []
+        for offset in range(0, len(data) - _RECORD.size + 1, _RECORD.size):
+            record = _RECORD.unpack_from(data, offset)
+            if record[0] < cutoff:
+                continue
+            self._index(record[0], record[1:-1], int.from_bytes(record[-1], 'little').bit_count())
+            kept.append(data[offset:offset + _RECORD.size])
+
+        dropped = len(data) // _RECORD.size - len(kept)
+        if len(kept) * _RECORD.size != len(data):
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(kept))
+            os.replace(tmp_path, self.path)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        logger.info(f"Loaded {len(self._timestamps)} caption signatures ({dropped} expired)")
+
+    def _sync(self):
+        """Reload if another process replaced or appended to the file."""
+        try:
+            on_disk = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            on_disk = None
+        opened = os.fstat(self._file.fileno())
+        if on_disk != opened.st_ino or opened.st_size != len(self._timestamps) * _RECORD.size:
+            self._load()
+
+    def _fingerprint(self, entry_id: int) -> int:
+        end = (entry_id + 1) * _RECORD.size
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return int.from_bytes(self._map[end - _RECORD.size + _FINGERPRINT_OFFSET:end], 'little')
+
+    def _scores(self, text: str) -> Iterator[float]:
+        """Yield the similarity of text to each candidate in the window; call with the lock held."""
+        keys, bits = sketch(text)
+        count = bits.bit_count()
+        cutoff = time.time() - self.window
+
+        candidates = set()
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if isinstance(bucket, int):
+                candidates.add(bucket)
+            elif bucket:
+                candidates.update(bucket)
+
+        for entry_id in candidates:
+            if self._timestamps[entry_id] >= cutoff:
+                yield _jaccard_counted(bits, count, self._fingerprint(entry_id), self._bit_counts[entry_id])
+
+    def similarity(self, text: str) -> float:
+        """Return the highest similarity to a caption in the window."""
+        with self._lock:
+            return max(self._scores(text), default=0.0)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Return True if text is too similar to a recently posted caption."""
+        with self._lock:
+            return any(score >= self.threshold for score in self._scores(text))
+
+    def add(self, text: str, timestamp: Optional[float] = None):
+        """Record a posted caption."""
+        timestamp = timestamp or time.time()
+        keys, bits = sketch(text)
+        with self._lock:
+            self._sync()
+            self._file.write(self._pack(timestamp, keys, bits))
+            self._file.flush()
+            self._index(timestamp, keys, bits.bit_count())
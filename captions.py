@@ -0,0 +1,143 @@
+"""Caption bundles with per-platform variants.
+
+A CaptionBundle is a str (the full description) that also carries a short
+title, a tweet-length variant and a hashtag set, so platforms with tight
+limits can pick a variant written for them instead of slicing the text.
+Posters receive plain strings too, so the helpers below derive a variant
+from any str when no bundle is available.
+"""
+
+import re
+from typing import Callable, Iterable, List, Optional
+
+TWEET_LIMIT = 280
+
+# Media captions on Telegram (sendPhoto/sendMediaGroup) and WhatsApp images
+PHOTO_CAPTION_LIMIT = 1024
+
+_HASHTAG_RE = re.compile(r'#\w+')
+
+# Code point ranges twitter-text counts as weight 1; everything else counts 2
+_TWITTER_LIGHT_RANGES = ((0, 4351), (8192, 8205), (8208, 8223), (8242, 8247))
+
+
+def twitter_length(text: str) -> int:
+    """Return the weighted length Twitter/X uses for the 280 character limit."""
+    length = 0
+    for char in text:
+        code = ord(char)
+        length += 1 if any(lo <= code <= hi for lo, hi in _TWITTER_LIGHT_RANGES) else 2
+    return length
+
+
+def fit_text(text: str, limit: int, length: Callable[[str], int] = len) -> str:
+    """Shorten text to fit limit, cutting at a word boundary with an ellipsis."""
+    text = text.strip()
+    if length(text) <= limit:
+        return text
+
+    words = text.split()
+    while words and length(' '.join(words) + '…') > limit:
+        words.pop()
+    if words:
+        return ' '.join(words).rstrip(',.;:-') + '…'
+
+    # A single word longer than the limit
+    cut = text
+    while cut and length(cut + '…') > limit:
+        cut = cut[:-1]
+    return cut + '…'
+
+
+def extract_hashtags(text: str) -> List[str]:
+    """Return the hashtags in text, in order, without duplicates."""
+    seen = []
+    for tag in _HASHTAG_RE.findall(text):
+        if tag.lower() not in (s.lower() for s in seen):
+            seen.append(tag)
+    return seen
+
+
+def _normalize_hashtags(tags: Iterable[str]) -> List[str]:
+    result = []
+    for tag in tags:
+        tag = str(tag).strip().replace(' ', '')
+        if not tag:
+            continue
+        result.append(tag if tag.startswith('#') else f"#{tag}")
+    return result
+
+
+class CaptionBundle(str):
+    """Caption whose string value is the long description.
+
+    Attributes:
+        headline: Short title (Reddit titles, YouTube titles)
+        tweet: Tweet-length variant
+        hashtags: Hashtags for the post, including the leading '#'
+    """
+
+    def __new__(cls, description: str, title: Optional[str] = None, tweet: Optional[str] = None,
+                hashtags: Optional[Iterable[str]] = None):
+        description = description.strip()
+        tags = _normalize_hashtags(hashtags) if hashtags else extract_hashtags(description)
+
+        # Make sure the description carries its hashtags
+        missing = [t for t in tags if t.lower() not in description.lower()]
+        if missing:
+            description = f"{description} {' '.join(missing)}".strip()
+
+        bundle = super().__new__(cls, description)
+        bundle.hashtags = tags
+        bundle.headline = (title or '').strip() or fit_text(_HASHTAG_RE.sub('', description).strip() or description, 100)
+        bundle.tweet = (tweet or '').strip() or description
+        if twitter_length(bundle.tweet) > TWEET_LIMIT:
+            bundle.tweet = fit_text(bundle.tweet, TWEET_LIMIT, twitter_length)
+        return bundle
+
+    @classmethod
+    def from_text(cls, text: str) -> 'CaptionBundle':
+        """Build a bundle from a single caption."""
+        return cls(text)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CaptionBundle':
+        """Build a bundle from model output or cached data."""
+        description = data.get('description') or data.get('text') or data.get('tweet') or ''
+        return cls(description, title=data.get('title'), tweet=data.get('tweet'), hashtags=data.get('hashtags'))
+
+    def to_dict(self) -> dict:
+        """Serialize the bundle for caching."""
+        return {'title': self.headline, 'tweet': self.tweet, 'description': str(self), 'hashtags': self.hashtags}
+
+
+def caption_title(text: str, limit: int) -> str:
+    """Return a title of at most limit characters for a caption."""
+    bundle = text if isinstance(text, CaptionBundle) else CaptionBundle.from_text(text)
+    return fit_text(bundle.headline, limit)
+
+
+def caption_tweet(text: str) -> str:
+    """Return a variant of a caption within Twitter's weighted 280 limit."""
+    bundle = text if isinstance(text, CaptionBundle) else CaptionBundle.from_text(text)
+    return fit_text(bundle.tweet, TWEET_LIMIT, twitter_length)
+
+
+def caption_fit(text: str, limit: int) -> str:
+    """Return the caption within limit characters, keeping its hashtags when they fit."""
+    text = str(text).strip()
+    if len(text) <= limit:
+        return text
+
+    tags = ' '.join(caption_hashtags(text))
+    body = ' '.join(_HASHTAG_RE.sub('', text).split())
+    if tags and body and len(tags) < limit // 2:
+        return f"{fit_text(body, limit - len(tags) - 1)} {tags}"
+    return fit_text(text, limit)
+
+
+def caption_hashtags(text: str) -> List[str]:
+    """Return the hashtags for a caption."""
+    if isinstance(text, CaptionBundle):
+        return list(text.hashtags)
+    return extract_hashtags(text)
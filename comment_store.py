@@ -0,0 +1,189 @@
+"""Persistent pool of pre-generated captions keyed by image content.
+
+Each pool is keyed by (image content hash, prompt version, model) and holds
+several candidate captions, stored with their per-platform variants. A caption is handed out until it has been used
+COMMENT_MAX_USES times; candidates are also evicted once they are older than
+COMMENT_CACHE_MAX_AGE_DAYS. Whole pools are evicted least-recently-used first
+once more than COMMENT_CACHE_MAX_IMAGES images are cached.
+
+Pools live in a SQLite database (CACHE_DIR/comments.db), so taking or adding a
+caption only writes the rows it touches, and the bot and
+scripts/pregenerate_captions.py can update the store at the same time. An
+existing comments.json from older versions is imported on first use.
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+from captions import CaptionBundle
+from content_cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    key TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captions (
+    pool_key TEXT NOT NULL REFERENCES pools(key) ON DELETE CASCADE,
+    text TEXT NOT NULL,
+    variants TEXT,
+    created_at REAL NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (pool_key, text)
+);
+CREATE INDEX IF NOT EXISTS pools_last_used ON pools(last_used);
+"""
+
+
+class CommentStore:
+    """Caption pools persisted to CACHE_DIR/comments.db."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.max_uses = int(os.getenv('COMMENT_MAX_USES', '1'))
+        self.max_age = float(os.getenv('COMMENT_CACHE_MAX_AGE_DAYS', '90')) * 86400
+        self.max_images = int(os.getenv('COMMENT_CACHE_MAX_IMAGES', '20000'))
+        self.path = Path(path) if path else get_cache_dir() / 'comments.db'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._adds_since_evict = 0
+
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions so
+        # a read-modify-write never interleaves with another process
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        self._db.executescript(_SCHEMA)
+        self._import_json(self.path.with_name('comments.json'))
+
+    @staticmethod
+    def make_key(image_hash: str, prompt_version: str, model: str) -> str:
+        """Build the pool key for an image/prompt/model combination."""
+        return f"{image_hash}:{prompt_version}:{model}"
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction that holds the database lock from the start."""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def _import_json(self, json_path: Path):
+        """Import pools from the JSON file used by older versions, once."""
+        if not json_path.exists():
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+        except Exception as e:
+            logger.warning(f"Could not import {json_path}: {e}")
+            return
+
+        imported = 0
+        with self._lock, self._transaction() as db:
+            for key, entry in data.items():
+                pool = (entry or {}).get('value') or {}
+                db.execute('INSERT OR IGNORE INTO pools (key, last_used) VALUES (?, ?)',
+                           (key, pool.get('last_used', time.time())))
+                for c in pool.get('captions', []):
+                    db.execute(
+                        'INSERT OR IGNORE INTO captions (pool_key, text, variants, created_at, uses) VALUES (?, ?, ?, ?, ?)',
+                        (key, c['text'], json.dumps(c['variants']) if c.get('variants') else None,
+                         c.get('created_at', time.time()), c.get('uses', 0))
+                    )
+                imported += 1
+        try:
+            os.replace(json_path, json_path.with_name(json_path.name + '.imported'))
+        except FileNotFoundError:
+            pass  # another process imported it at the same time
+        logger.info(f"Imported {imported} caption pools from {json_path}")
+
+    def _prune_pool(self, db: sqlite3.Connection, key: str, now: float):
+        db.execute('DELETE FROM captions WHERE pool_key = ? AND (uses >= ? OR created_at < ?)',
+                   (key, self.max_uses, now - self.max_age))
+
+    def available(self, key: str) -> int:
+        """Return how many unused captions remain in a pool."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT COUNT(*) FROM captions WHERE pool_key = ? AND uses < ? AND created_at >= ?',
+                (key, self.max_uses, time.time() - self.max_age)
+            ).fetchone()
+        return row[0]
+
+    def take(self, key: str) -> Optional[str]:
+        """Pick an unused caption from a pool and mark it used.
+
+        Returns:
+            Caption (a CaptionBundle if it was stored with variants), or None
+            if the pool is empty
+        """
+        with self._lock, self._transaction() as db:
+            now = time.time()
+            captions = db.execute(
+                'SELECT text, variants FROM captions WHERE pool_key = ? AND uses < ? AND created_at >= ?',
+                (key, self.max_uses, now - self.max_age)
+            ).fetchall()
+            if not captions:
+                return None
+
+            text, variants = random.choice(captions)
+            db.execute('UPDATE captions SET uses = uses + 1 WHERE pool_key = ? AND text = ?', (key, text))
+            self._prune_pool(db, key, now)
+            db.execute('UPDATE pools SET last_used = ? WHERE key = ?', (now, key))
+
+        if variants:
+            return CaptionBundle.from_dict(json.loads(variants))
+        return text
+
+    def add(self, key: str, captions: List[str]):
+        """Add freshly generated captions (plain or CaptionBundle) to a pool."""
+        captions = [c for c in captions if c and c.strip()]
+        if not captions:
+            return
+
+        with self._lock:
+            with self._transaction() as db:
+                now = time.time()
+                db.execute('INSERT INTO pools (key, last_used) VALUES (?, ?) '
+                           'ON CONFLICT(key) DO UPDATE SET last_used = excluded.last_used', (key, now))
+                self._prune_pool(db, key, now)
+                db.executemany(
+                    'INSERT OR IGNORE INTO captions (pool_key, text, variants, created_at) VALUES (?, ?, ?, ?)',
+                    [
+                        (key, str(caption).strip(),
+                         json.dumps(caption.to_dict()) if isinstance(caption, CaptionBundle) else None, now)
+                        for caption in captions
+                    ]
+                )
+
+            # Eviction touches every pool, so only run it periodically
+            self._adds_since_evict += 1
+            if self._adds_since_evict >= 100:
+                self._adds_since_evict = 0
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop stale pools and enforce the image cap."""
+        with self._transaction() as db:
+            db.execute('DELETE FROM pools WHERE last_used < ?', (now - self.max_age,))
+            overflow = db.execute('SELECT COUNT(*) FROM pools').fetchone()[0] - self.max_images
+            if overflow > 0:
+                db.execute('DELETE FROM pools WHERE key IN (SELECT key FROM pools ORDER BY last_used LIMIT ?)',
+                           (overflow,))
+                logger.info(f"Evicted {overflow} caption pools over the {self.max_images} image cap")
@@ -0,0 +1,211 @@
+"""Content-addressed helpers and small persistent caches.
+
+Images are identified by the SHA-256 of their bytes rather than their file
+name, so renaming or re-adding an image keeps its cached state. Cached state
+lives in small JSON files under CACHE_DIR (default: ./cache).
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are merged but not locked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_hash_lock = threading.Lock()
+
+
+def get_cache_dir() -> Path:
+    """Return the cache directory, creating it if needed."""
+    cache_dir = Path(os.getenv('CACHE_DIR', './cache'))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def content_hash(path: Path) -> str:
+    """Return the SHA-256 hex digest of a file's contents.
+
+    Digests are memoized per (path, size, mtime) so repeated lookups of the
+    same unchanged file do not re-read it.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Hex encoded SHA-256 digest
+    """
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        cached = _hash_memo.get(memo_key)
+    if cached:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _hash_lock:
+        _hash_memo[memo_key] = value
+    return value
+
+
+class JsonStore:
+    """Thread-safe key/value store persisted as a single JSON file.
+
+    Every entry records when it was written so callers can expire it with a
+    TTL. Writes go to a temporary file that is atomically renamed into place.
+
+    Several processes (the bot and the scripts) may share a store: a flush
+    takes an exclusive lock on a sidecar .lock file, re-reads the file and
+    writes back only the keys this process changed, and reads pick up the
+    file again whenever another process has rewritten it.
+    """
+
+    def __init__(self, path: Path, ttl: Optional[float] = None, autosave: bool = True):
+        """Load the store from disk.
+
+        Args:
+            path: JSON file backing the store
+            ttl: Optional lifetime of entries in seconds
+            autosave: Persist after every mutation (disable for bulk writes
+                and call flush() instead)
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.autosave = autosave
+        self._lock = threading.RLock()
+        self._data: Dict[str, Dict[str, Any]] = {}
+        # Keys set or deleted here since the last flush
+        self._dirty: Set[str] = set()
+        # (mtime, size) of the file as last read or written by this process
+        self._file_state: Optional[Tuple[int, int]] = None
+        self._load()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache file {self.path}: {e}")
+        return {}
+
+    def _merge(self, disk: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Return the file's entries with this process's unsaved changes applied."""
+        for key in self._dirty:
+            if key in self._data:
+                disk[key] = self._data[key]
+            else:
+                disk.pop(key, None)
+        return disk
+
+    def _load(self):
+        with self._lock:
+            state = self._stat()
+            self._data = self._merge(self._read())
+            self._file_state = state
+
+    def _refresh(self):
+        """Reload if another process has rewritten the file."""
+        if self._stat() != self._file_state:
+            self._load()
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl is not None and now - entry.get('created_at', 0) > self.ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value for key, or default if missing or expired."""
+        with self._lock:
+            self._refresh()
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry, time.time()):
+                return default
+            return entry.get('value')
+
+    def set(self, key: str, value: Any):
+        """Store value under key."""
+        with self._lock:
+            self._data[key] = {'value': value, 'created_at': time.time()}
+            self._dirty.add(key)
+            if self.autosave:
+                self.flush()
+
+    def delete(self, key: str):
+        """Remove key if present."""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._dirty.add(key)
+                if self.autosave:
+                    self.flush()
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Iterate over unexpired (key, value) pairs."""
+        now = time.time()
+        with self._lock:
+            self._refresh()
+            snapshot = list(self._data.items())
+        for key, entry in snapshot:
+            if not self._expired(entry, now):
+                yield key, entry.get('value')
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def prune(self) -> int:
+        """Drop expired entries.
+
+        Returns:
+            Number of entries removed
+        """
+        now = time.time()
+        with self._lock:
+            expired = [k for k, entry in self._data.items() if self._expired(entry, now)]
+            for key in expired:
+                del self._data[key]
+            self._dirty.update(expired)
+            if expired and self.autosave:
+                self.flush()
+        return len(expired)
+
+    def flush(self):
+        """Merge this process's changes into the file on disk."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path.with_suffix(self.path.suffix + '.lock'), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                data = self._merge(self._read())
+                tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._file_state = self._stat()
+            self._data = data
+            self._dirty.clear()
@@ -51,6 +51,25 @@ class ImageManager:
         logger.info(f"Selected image: {selected.name}")
         return selected
 
+    def get_random_images(self, count: int) -> List[Path]:
+        """Get several distinct random images for an album post.
+        
+        Args:
+            count: Number of images wanted
+            
+        Returns:
+            Up to count distinct image paths (fewer if the collection is smaller)
+        """
+        images = self._get_image_list()
+        
+        if not images:
+            logger.warning("No images found in image directory")
+            return []
+        
+        selected = random.sample(images, min(count, len(images)))
+        logger.info(f"Selected images: {', '.join(p.name for p in selected)}")
+        return selected
+
     def _create_placeholder(self):
         """Create a placeholder image with instructions."""
         placeholder_path = self.image_dir / 'README.txt'
@@ -1,17 +1,28 @@
 """Media hosting helper for uploading local images to public URLs.
 
-Supports S3 and Imgur for platforms that require publicly accessible media URLs
-like Instagram Graph API, Twilio WhatsApp, etc.
+Supports S3, Imgur and a built-in local HTTP server for platforms that require
+publicly accessible media URLs like Instagram Graph API, Twilio WhatsApp, etc.
+
+Hosted URLs are remembered per image content hash (CACHE_DIR/hosted_media.json)
+for MEDIA_URL_CACHE_TTL_HOURS, so posting the same image again skips the upload.
 """
 
 import os
+import re
+import shutil
 import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 import mimetypes
 
 import requests
 
+from content_cache import JsonStore, content_hash, get_cache_dir
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,46 +32,121 @@ class MediaHostingError(Exception):
 
 
 class S3MediaHost:
-    """Upload images to AWS S3 and return public URLs."""
-    
+    """Upload images and videos to S3 (or an S3-compatible store) and return URLs.
+
+    Large files are uploaded in parallel multipart chunks. With S3_PRESIGN=true
+    objects stay private and time-limited presigned GET URLs are returned
+    instead of public-read URLs.
+    """
+
+    cache_urls = True
+
+    # Pooled clients shared by every host instance, keyed by connection settings
+    _clients = {}
+    _clients_lock = threading.Lock()
+
     def __init__(self):
         self.bucket = os.getenv('AWS_S3_BUCKET')
         self.access_key = os.getenv('AWS_ACCESS_KEY_ID')
         self.secret_key = os.getenv('AWS_SECRET_ACCESS_KEY')
         self.region = os.getenv('AWS_REGION', 'us-east-1')
-        
+        self.endpoint_url = (os.getenv('S3_ENDPOINT_URL') or os.getenv('AWS_ENDPOINT_URL') or '').rstrip('/') or None
+        self.presign = os.getenv('S3_PRESIGN', 'false').lower() == 'true'
+        self.presign_expiry = int(os.getenv('S3_PRESIGN_EXPIRY', '3600'))
+        self.max_pool_connections = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '16'))
+
         if not all([self.bucket, self.access_key, self.secret_key]):
             raise MediaHostingError("Missing AWS S3 credentials: AWS_S3_BUCKET, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY")
-        
+
         try:
-            import boto3
-            self.s3 = boto3.client(
-                's3',
-                aws_access_key_id=self.access_key,
-                aws_secret_access_key=self.secret_key,
-                region_name=self.region
-            )
+            from boto3.s3.transfer import TransferConfig
         except ImportError:
             raise MediaHostingError("boto3 package required for S3 hosting. Install with: pip install boto3")
 
+        mb = 1024 * 1024
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(float(os.getenv('S3_MULTIPART_THRESHOLD_MB', '8')) * mb),
+            multipart_chunksize=int(float(os.getenv('S3_MULTIPART_CHUNKSIZE_MB', '8')) * mb),
+            max_concurrency=int(os.getenv('S3_MAX_CONCURRENCY', '8')),
+            use_threads=True
+        )
+        self.s3 = self._get_client()
+
+        # Presigned URLs expire, so they must not outlive the hosted URL cache
+        self.cache_urls = not self.presign
+
+    def _get_client(self):
+        """Return the shared pooled client for this configuration."""
+        key = (self.access_key, self.region, self.endpoint_url, self.max_pool_connections)
+        with S3MediaHost._clients_lock:
+            client = S3MediaHost._clients.get(key)
+            if client is None:
+                import boto3
+                from botocore.config import Config
+
+                client = boto3.client(
+                    's3',
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    region_name=self.region,
+                    endpoint_url=self.endpoint_url,
+                    config=Config(
+                        max_pool_connections=self.max_pool_connections,
+                        retries={'max_attempts': 5, 'mode': 'adaptive'}
+                    )
+                )
+                S3MediaHost._clients[key] = client
+            return client
+
+    def _exists(self, key: str) -> bool:
+        """Check whether an object already exists with a cheap HEAD request."""
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def _url(self, key: str) -> str:
+        if self.presign:
+            return self.s3.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': key},
+                ExpiresIn=self.presign_expiry
+            )
+        if self.endpoint_url:
+            return f"{self.endpoint_url}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
+
     def upload(self, image_path: Path) -> str:
-        """Upload image to S3 and return public URL."""
+        """Upload a file to S3 and return a public or presigned URL."""
         try:
-            key = f"lain-social/{image_path.name}"
-            
-            # Upload with public-read ACL
+            # Content-addressed key: identical files map to the same object
+            key = f"lain-social/{content_hash(image_path)}{image_path.suffix.lower()}"
+
+            if self._exists(key):
+                url = self._url(key)
+                logger.info(f"Already on S3, skipping upload: {key}")
+                return url
+
+            content_type = mimetypes.guess_type(str(image_path))[0] or 'application/octet-stream'
+            extra_args = {'ContentType': content_type}
+            if not self.presign:
+                extra_args['ACL'] = 'public-read'
+
             self.s3.upload_file(
                 str(image_path),
                 self.bucket,
                 key,
-                ExtraArgs={'ACL': 'public-read'}
+                ExtraArgs=extra_args,
+                Config=self.transfer_config
             )
-            
-            # Return public URL
-            url = f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
-            logger.info(f"Uploaded to S3: {url}")
+
+            url = self._url(key)
+            logger.info(f"Uploaded to S3: {key} ({image_path.stat().st_size / 1024:.0f} KiB)")
             return url
-            
+
+        except MediaHostingError:
+            raise
         except Exception as e:
             raise MediaHostingError(f"S3 upload failed: {e}")
 
@@ -102,31 +188,313 @@ class ImgurMediaHost:
             raise MediaHostingError(f"Imgur upload failed: {e}")
 
 
+_HOSTED_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _LocalMediaHandler(BaseHTTPRequestHandler):
+    """Serves content-addressed files from LocalMediaHost.media_dir with Range support."""
+
+    media_dir: Path = Path('.')
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool):
+        name = self.path.split('?', 1)[0].rsplit('/', 1)[-1]
+        path = self.media_dir / name
+        if not _HOSTED_NAME_RE.match(name) or not path.is_file():
+            self.send_error(404)
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        status = 200
+
+        # Malformed and multi-range headers are ignored (RFC 9110 lets a server
+        # serve the full body for a Range it does not support)
+        match = _RANGE_RE.match((self.headers.get('Range') or '').strip())
+        first, last = (match.group(1), match.group(2)) if match else ('', '')
+        if (first or last) and not (first and last and int(last) < int(first)):
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                # Suffix range: the last N bytes
+                start = max(0, size - int(last))
+            if start > end or start >= size:
+                self._range_not_satisfiable(size)
+                return
+            status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header('Content-Type', mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{name.split(".")[0]}"')
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        if not send_body:
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def _range_not_satisfiable(self, size: int):
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{size}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(f"Local media host: {format % args}")
+
+
+class LocalMediaHost:
+    """Serve images over HTTP from inside the bot process.
+
+    Images are copied (or hard-linked) into MEDIA_LOCAL_DIR under their content
+    hash and served on MEDIA_LOCAL_BIND:MEDIA_LOCAL_PORT. MEDIA_LOCAL_PUBLIC_URL
+    is the externally reachable base URL, typically a reverse proxy or tunnel
+    pointing at that port.
+    """
+
+    _server: Optional[ThreadingHTTPServer] = None
+    _server_lock = threading.Lock()
+
+    def __init__(self):
+        self.public_url = os.getenv('MEDIA_LOCAL_PUBLIC_URL')
+        if not self.public_url:
+            raise MediaHostingError("Missing MEDIA_LOCAL_PUBLIC_URL environment variable")
+
+        self.public_url = self.public_url.rstrip('/')
+        self.media_dir = Path(os.getenv('MEDIA_LOCAL_DIR') or get_cache_dir() / 'media')
+        self.media_dir.mkdir(parents=True, exist_ok=True)
+        self.bind = os.getenv('MEDIA_LOCAL_BIND', '0.0.0.0')
+        self.port = int(os.getenv('MEDIA_LOCAL_PORT', '8081'))
+        self._ensure_server()
+
+    def _ensure_server(self):
+        """Start the shared HTTP server once per process."""
+        with LocalMediaHost._server_lock:
+            if LocalMediaHost._server is not None:
+                return
+            handler = type('LocalMediaHandler', (_LocalMediaHandler,), {'media_dir': self.media_dir})
+            try:
+                server = ThreadingHTTPServer((self.bind, self.port), handler)
+            except OSError as e:
+                raise MediaHostingError(f"Cannot listen on {self.bind}:{self.port}: {e}")
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True, name='local-media-host').start()
+            LocalMediaHost._server = server
+            logger.info(f"Local media host serving {self.media_dir} on {self.bind}:{self.port}")
+
+    def upload(self, image_path: Path) -> str:
+        """Publish image into the served directory and return its public URL."""
+        try:
+            name = f"{content_hash(image_path)}{image_path.suffix.lower()}"
+            target = self.media_dir / name
+
+            if not target.exists():
+                tmp_path = self.media_dir / f".{name}.tmp"
+                try:
+                    os.link(image_path, tmp_path)
+                except OSError:
+                    shutil.copyfile(image_path, tmp_path)
+                os.replace(tmp_path, target)
+
+            url = f"{self.public_url}/{name}"
+            logger.info(f"Hosted locally: {url}")
+            return url
+
+        except OSError as e:
+            raise MediaHostingError(f"Local hosting failed: {e}")
+
+
+_HOST_CLASSES = {
+    's3': S3MediaHost,
+    'imgur': ImgurMediaHost,
+    'local': LocalMediaHost,
+}
+
+
 class MediaHostingManager:
-    """Manages media hosting using configured provider."""
+    """Manages media hosting across the configured providers.
+
+    MEDIA_HOSTING_PROVIDER is an ordered, comma-separated list (e.g.
+    "local,s3,imgur"). Uploads go to the first healthy provider and fail over
+    to the next one on error, or once MEDIA_HOSTING_TIMEOUT seconds pass while
+    another provider is still untried. A
+    provider that fails is skipped for MEDIA_HOSTING_COOLDOWN seconds, doubling
+    on repeated failures. With MEDIA_HOSTING_RACE=true the first two healthy
+    providers are started together and the first URL back wins.
+    """
     
     def __init__(self):
-        """Initialize with the configured hosting provider."""
-        provider = os.getenv('MEDIA_HOSTING_PROVIDER', 'imgur').lower()
+        """Initialize with the configured hosting providers."""
+        names = [p.strip().lower() for p in os.getenv('MEDIA_HOSTING_PROVIDER', 'imgur').split(',') if p.strip()]
         
-        if provider == 's3':
-            self.host = S3MediaHost()
-        elif provider == 'imgur':
-            self.host = ImgurMediaHost()
-        else:
-            raise MediaHostingError(f"Unknown media hosting provider: {provider}. Use 's3' or 'imgur'")
+        self.hosts = {}
+        errors = []
+        for name in names:
+            if name not in _HOST_CLASSES:
+                raise MediaHostingError(f"Unknown media hosting provider: {name}. Use 's3', 'imgur' or 'local'")
+            try:
+                self.hosts[name] = _HOST_CLASSES[name]()
+            except MediaHostingError as e:
+                if len(names) == 1:
+                    raise
+                logger.warning(f"Media host '{name}' unavailable: {e}")
+                errors.append(f"{name}: {e}")
         
-        self.provider = provider
-        logger.info(f"Media hosting initialized: {provider}")
+        if not self.hosts:
+            raise MediaHostingError(f"No media hosting provider could be initialized ({'; '.join(errors)})")
+        
+        self.providers = list(self.hosts)
+        self.provider = self.providers[0]
+        self.host = self.hosts[self.provider]
+        logger.info(f"Media hosting initialized: {', '.join(self.providers)}")
+
+        self.timeout = float(os.getenv('MEDIA_HOSTING_TIMEOUT', '20'))
+        self.cooldown = float(os.getenv('MEDIA_HOSTING_COOLDOWN', '300'))
+        self.race = os.getenv('MEDIA_HOSTING_RACE', 'false').lower() == 'true'
+        self._health = {name: {'failures': 0, 'retry_at': 0.0} for name in self.providers}
+        self._health_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.providers)),
+                                            thread_name_prefix='media-host')
+
+        # Content hash -> hosted URL, so repeat posts skip the upload
+        ttl_hours = float(os.getenv('MEDIA_URL_CACHE_TTL_HOURS', '168'))
+        self.verify_cached = os.getenv('MEDIA_URL_VERIFY', 'true').lower() == 'true'
+        self.url_cache = JsonStore(get_cache_dir() / 'hosted_media.json', ttl=ttl_hours * 3600)
+
+    def _is_reachable(self, url: str) -> bool:
+        """Verify a previously hosted URL still serves content."""
+        try:
+            resp = requests.head(url, allow_redirects=True, timeout=10)
+            return resp.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def _mark_success(self, provider: str):
+        with self._health_lock:
+            self._health[provider] = {'failures': 0, 'retry_at': 0.0}
+
+    def _mark_failure(self, provider: str):
+        with self._health_lock:
+            health = self._health[provider]
+            health['failures'] += 1
+            backoff = min(self.cooldown * 2 ** (health['failures'] - 1), 3600)
+            health['retry_at'] = time.monotonic() + backoff
+        logger.info(f"Media host '{provider}' cooling down for {backoff:.0f}s")
+
+    def _ordered_providers(self) -> List[str]:
+        """Healthy providers in configured order, then cooling-down ones."""
+        now = time.monotonic()
+        with self._health_lock:
+            healthy = [p for p in self.providers if self._health[p]['retry_at'] <= now]
+            cooling = sorted((p for p in self.providers if p not in healthy),
+                             key=lambda p: self._health[p]['retry_at'])
+        return healthy + cooling
+
+    def _upload_with(self, provider: str, image_path: Path, cache_key: str) -> str:
+        url = self.hosts[provider].upload(image_path)
+        if getattr(self.hosts[provider], 'cache_urls', True):
+            self.url_cache.set(f"{provider}:{cache_key}", url)
+        return url
+
+    def _upload(self, image_path: Path, cache_key: str) -> str:
+        """Upload through the provider chain, failing over on errors and timeouts."""
+        remaining = self._ordered_providers()
+        running = {}  # future -> (provider, started_at)
+        errors = []
+
+        def launch():
+            provider = remaining.pop(0)
+            running[self._executor.submit(self._upload_with, provider, image_path, cache_key)] = \
+                (provider, time.monotonic())
+
+        launch()
+        if self.race and remaining:
+            launch()
+
+        while running:
+            now = time.monotonic()
+            # With nothing left to fail over to, let the hosts' own request timeouts apply
+            timeout = None
+            if remaining:
+                deadline = min(started + self.timeout for _, started in running.values())
+                timeout = max(0.0, deadline - now)
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                provider, started = running.pop(future)
+                try:
+                    url = future.result()
+                except Exception as e:
+                    logger.warning(f"Media host '{provider}' failed: {e}")
+                    errors.append(f"{provider}: {e}")
+                    self._mark_failure(provider)
+                    continue
+                self._mark_success(provider)
+                logger.info(f"Hosted {image_path.name} via {provider} in {now - started:.1f}s")
+                return url
+
+            for future, (provider, started) in list(running.items()):
+                if remaining and now - started >= self.timeout:
+                    # The upload keeps running; if it completes, its URL is still cached
+                    logger.warning(f"Media host '{provider}' exceeded {self.timeout:g}s, failing over")
+                    errors.append(f"{provider}: timed out")
+                    self._mark_failure(provider)
+                    del running[future]
+
+            while remaining and len(running) < (2 if self.race else 1):
+                launch()
+
+        raise MediaHostingError(f"All media hosts failed ({'; '.join(errors)})")
     
     def upload_image(self, image_path: Path) -> str:
-        """Upload image and return public URL."""
+        """Upload image and return public URL, reusing a cached URL when possible."""
         if not image_path.exists():
             raise MediaHostingError(f"Image file not found: {image_path}")
         
-        return self.host.upload(image_path)
+        image_hash = content_hash(image_path)
+        for provider in self.providers:
+            cache_key = f"{provider}:{image_hash}"
+            url = self.url_cache.get(cache_key)
+            if not url:
+                continue
+            if not self.verify_cached or self._is_reachable(url):
+                logger.info(f"Reusing hosted URL for {image_path.name}: {url}")
+                return url
+            logger.info(f"Cached URL no longer reachable, re-uploading: {url}")
+            self.url_cache.delete(cache_key)
+        
+        return self._upload(image_path, image_hash)
+
+
+_media_host: Optional[MediaHostingManager] = None
+_media_host_lock = threading.Lock()
 
 
 def get_media_host() -> MediaHostingManager:
-    """Get a configured media hosting manager."""
-    return MediaHostingManager()
\ No newline at end of file
+    """Get the shared media hosting manager, creating it on first use."""
+    global _media_host
+    with _media_host_lock:
+        if _media_host is None:
+            _media_host = MediaHostingManager()
+        return _media_host
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""Thread-safe token bucket rate limiter."""
+
+import time
+import threading
+from typing import Optional
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second.
+
+    Up to `burst` tokens may accumulate while idle. A request for more than
+    `burst` tokens goes through once the bucket is full and leaves it in
+    debt, so later requests wait until the overdraft is paid off. A rate of
+    0 or less disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens if available.
+
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they would be
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # The bucket never holds more than burst, so that is all a large request can wait for
+            needed = min(tokens, self.burst)
+            if self._tokens >= needed:
+                self._tokens -= tokens
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until tokens are available, then take them."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Pre-generate AI captions for every image in the library.
+
+Walks the image directory and fills each image's caption pool in the comment
+store (see comment_store.py) through the configured AI provider, so the bot
+can post without calling the provider during a cycle.
+
+Usage examples:
+  # Fill every pool with COMMENT_POOL_SIZE captions, 8 requests in flight, max 2/s
+  python3 scripts/pregenerate_captions.py --concurrency 8 --rate 2
+
+  # Only show which images still need captions
+  python3 scripts/pregenerate_captions.py --dry-run
+
+Progress is checkpointed, so an interrupted run resumes where it stopped.
+Images whose pool already holds --count unused captions are skipped.
+
+The script can run while the bot is running: captions are committed to the
+shared SQLite store one pool at a time, and the JSON caches both processes use
+(descriptions, checkpoint) merge their changes under a file lock.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ai_comment_generator import CommentGenerator  # noqa: E402
+from content_cache import JsonStore, content_hash, get_cache_dir  # noqa: E402
+from rate_limit import RateLimiter  # noqa: E402
+
+SUPPORTED_EXT = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+logger = logging.getLogger('pregenerate_captions')
+
+
+def gather_images(dirpath: Path) -> List[Path]:
+    return sorted(p for p in dirpath.iterdir() if p.is_file() and p.suffix.lower() in SUPPORTED_EXT)
+
+
+def main(argv: List[str] | None = None) -> int:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    p = argparse.ArgumentParser(description="Pre-generate AI captions for all images")
+    p.add_argument('--dir', default=os.getenv('IMAGE_DIR', './images'), help='Image directory (default: IMAGE_DIR or ./images)')
+    p.add_argument('--count', type=int, default=int(os.getenv('COMMENT_POOL_SIZE', '5')), help='Captions to keep per image (default: COMMENT_POOL_SIZE)')
+    p.add_argument('--concurrency', type=int, default=4, help='Maximum requests in flight (default: 4)')
+    p.add_argument('--rate', type=float, default=1.0, help='Maximum requests started per second, 0 for unlimited (default: 1)')
+    p.add_argument('--checkpoint', default=None, help='Checkpoint file (default: CACHE_DIR/pregenerate_checkpoint.json)')
+    p.add_argument('--checkpoint-every', type=int, default=25, help='Persist progress every N images (default: 25)')
+    p.add_argument('--limit', type=int, default=0, help='Process at most N images (default: all)')
+    p.add_argument('--retry-failed', action='store_true', help='Retry images that failed in a previous run')
+    p.add_argument('--dry-run', action='store_true', help='List images that need captions but do not call the provider')
+    p.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
+    args = p.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    dirpath = Path(args.dir)
+    if not dirpath.is_dir():
+        print(f"Directory not found: {dirpath}")
+        return 2
+
+    generator = CommentGenerator()
+    if not generator.use_ai:
+        print("AI comments are disabled. Set USE_AI_COMMENTS=true and configure AI_PROVIDER.")
+        return 2
+
+    if generator.comment_store is None:
+        print("The comment cache is disabled or unavailable. Set COMMENT_CACHE=true.")
+        return 2
+
+    # Checkpoint writes are batched; captions are committed to the store as they arrive
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else get_cache_dir() / 'pregenerate_checkpoint.json'
+    checkpoint = JsonStore(checkpoint_path, autosave=False)
+
+    pending = []
+    for image_path in gather_images(dirpath):
+        image_hash = content_hash(image_path)
+        state = checkpoint.get(image_hash)
+        if state == 'failed' and not args.retry_failed:
+            continue
+        if generator.pool_available(image_path) >= args.count:
+            continue
+        pending.append((image_hash, image_path))
+        if args.limit and len(pending) >= args.limit:
+            break
+
+    print(f"{len(pending)} images need captions")
+    if args.dry_run:
+        for _, image_path in pending:
+            print(f"  {image_path.name}")
+        return 0
+
+    limiter = RateLimiter(args.rate, burst=1)
+
+    def work(image_path: Path) -> int:
+        limiter.acquire()
+        missing = args.count - generator.pool_available(image_path)
+        return generator.prefill(image_path, max(1, missing))
+
+    def save():
+        checkpoint.flush()
+
+    done = failed = 0
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, args.concurrency))
+    try:
+        futures = {executor.submit(work, path): (image_hash, path) for image_hash, path in pending}
+        for future in as_completed(futures):
+            image_hash, image_path = futures[future]
+            try:
+                future.result()
+                checkpoint.set(image_hash, 'done')
+                done += 1
+            except Exception as e:
+                logger.error(f"Failed to caption {image_path.name}: {e}")
+                checkpoint.set(image_hash, 'failed')
+                failed += 1
+
+            if (done + failed) % args.checkpoint_every == 0:
+                save()
+                rate = (done + failed) / max(time.monotonic() - started, 1e-6)
+                print(f"Progress: {done + failed}/{len(pending)} ({failed} failed, {rate:.2f} images/s)")
+    except KeyboardInterrupt:
+        print("Interrupted; saving progress...")
+        executor.shutdown(wait=False, cancel_futures=True)
+        save()
+        return 130
+    finally:
+        executor.shutdown(wait=True)
+        save()
+
+    print(f"Captioned {done} images ({failed} failed) in {time.monotonic() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
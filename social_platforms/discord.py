@@ -1,43 +1,179 @@
-"""Discord platform integration via webhook."""
+"""Discord platform integration via webhook.
+
+DISCORD_WEBHOOK_URL may list several webhooks (comma-separated), and
+DISCORD_WEBHOOKS_FILE adds one URL per line. The image is uploaded to the
+first webhook only; the CDN URL of that attachment is then embedded in the
+messages sent to the other webhooks. Requests run concurrently and are paced
+per rate-limit bucket from Discord's X-RateLimit-* response headers.
+"""
 
 import os
+import time
 import logging
+import threading
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import requests
 
+from broadcast import broadcast, load_targets
+
 logger = logging.getLogger(__name__)
 
 
+class _BucketPacer:
+    """Tracks Discord rate-limit buckets from response headers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._route_buckets: Dict[str, str] = {}
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._global_reset = 0.0
+
+    def wait(self, route: str):
+        """Block until a request on route is allowed, then reserve it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._global_reset - now
+                bucket = self._buckets.get(self._route_buckets.get(route, route))
+                if bucket and bucket['remaining'] <= 0 and bucket['reset_at'] > now:
+                    delay = max(delay, bucket['reset_at'] - now)
+                if delay <= 0:
+                    if bucket:
+                        bucket['remaining'] -= 1
+                    return
+            time.sleep(delay)
+
+    def update(self, route: str, resp: requests.Response):
+        """Record the bucket state reported by a response."""
+        headers = resp.headers
+        now = time.monotonic()
+        with self._lock:
+            bucket_id = headers.get('X-RateLimit-Bucket')
+            if bucket_id:
+                self._route_buckets[route] = bucket_id
+            key = self._route_buckets.get(route, route)
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset-After' in headers:
+                self._buckets[key] = {
+                    'remaining': int(headers['X-RateLimit-Remaining']),
+                    'reset_at': now + float(headers['X-RateLimit-Reset-After'])
+                }
+
+            if resp.status_code == 429:
+                try:
+                    retry_after = float(resp.json().get('retry_after', 1))
+                except ValueError:
+                    retry_after = float(headers.get('Retry-After', 1))
+                if headers.get('X-RateLimit-Global') or headers.get('X-RateLimit-Scope') == 'global':
+                    self._global_reset = now + retry_after
+                else:
+                    self._buckets[key] = {'remaining': 0, 'reset_at': now + retry_after}
+
+
 class DiscordPoster:
-    """Handler for posting to Discord using an incoming webhook."""
+    """Handler for posting to Discord using incoming webhooks."""
 
     platform_name = "Discord"
 
     def __init__(self):
-        self.webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
-        if not self.webhook_url:
+        self.webhooks = load_targets('DISCORD_WEBHOOK_URL', 'DISCORD_WEBHOOKS_FILE')
+        if not self.webhooks:
             raise ValueError("Missing DISCORD_WEBHOOK_URL environment variable")
 
-    def post(self, image_path: Path, text: str) -> bool:
-        """Post an image and text to Discord via webhook.
+        self.webhook_url = self.webhooks[0]
+        self.concurrency = int(os.getenv('DISCORD_CONCURRENCY', '5'))
+        self.session = requests.Session()
+        self.pacer = _BucketPacer()
 
-        This uploads the image as a file and posts the message content.
+    def _execute(self, webhook_url: str, **kwargs) -> Tuple[Optional[dict], int]:
+        """Execute a webhook with ?wait=true, honouring rate limits.
+
+        Returns:
+            Tuple of (created message or None on failure, HTTP status code)
         """
-        try:
-            with open(image_path, 'rb') as f:
-                files = {'file': (image_path.name, f)}
-                data = {'content': text}
-                resp = requests.post(self.webhook_url, data=data, files=files, timeout=30)
+        files = kwargs.get('files')
+        for attempt in range(3):
+            self.pacer.wait(webhook_url)
+            if files:
+                for _, handle in files.values():
+                    handle.seek(0)
+            resp = self.session.post(webhook_url, params={'wait': 'true'}, timeout=60, **kwargs)
+            self.pacer.update(webhook_url, resp)
 
             if resp.status_code in (200, 204):
-                logger.info("Successfully posted to Discord")
-                return True
+                return (resp.json() if resp.content else {}), resp.status_code
+            if resp.status_code == 429:
+                logger.warning("Discord rate limited, retrying")
+                continue
+
+            logger.error(f"Discord webhook returned {resp.status_code}: {resp.text}")
+            return None, resp.status_code
+        return None, 429
+
+    def _upload(self, webhook_url: str, image_paths: List[Path], text: str) -> Optional[List[str]]:
+        """Post images as attachments and return their CDN URLs."""
+        with ExitStack() as stack:
+            if len(image_paths) == 1:
+                files = {'file': (image_paths[0].name, stack.enter_context(open(image_paths[0], 'rb')))}
             else:
-                logger.error(f"Discord webhook returned {resp.status_code}: {resp.text}")
-                return False
+                files = {
+                    f'files[{i}]': (image_path.name, stack.enter_context(open(image_path, 'rb')))
+                    for i, image_path in enumerate(image_paths)
+                }
+            message, _ = self._execute(webhook_url, data={'content': text}, files=files)
+
+        if message is None:
+            return None
+        return [a.get('url') for a in message.get('attachments', []) if a.get('url')]
 
+    def _send_embeds(self, webhook_url: str, image_urls: List[str], text: str) -> bool:
+        """Post already-uploaded images by URL; embeds sharing a url render as a gallery."""
+        embeds = [{'url': image_urls[0], 'image': {'url': u}} for u in image_urls]
+        message, _ = self._execute(webhook_url, json={'content': text, 'embeds': embeds})
+        return message is not None
+
+    def _broadcast(self, image_paths: List[Path], text: str) -> bool:
+        image_urls: Optional[List[str]] = None
+
+        def upload(webhook_url: str) -> bool:
+            nonlocal image_urls
+            image_urls = self._upload(webhook_url, image_paths, text)
+            return image_urls is not None
+
+        def send(webhook_url: str) -> bool:
+            if image_urls and len(image_urls) == len(image_paths):
+                if self._send_embeds(webhook_url, image_urls, text):
+                    return True
+                logger.info("Embedding the uploaded image failed, uploading instead")
+            return self._upload(webhook_url, image_paths, text) is not None
+
+        # Upload to the first webhook that accepts the message, then embed its URLs
+        succeeded = broadcast(self.webhooks, send, self.concurrency, "Discord webhook", first=upload)
+
+        if succeeded:
+            logger.info(f"Successfully posted to Discord ({succeeded}/{len(self.webhooks)} webhooks)")
+        else:
+            logger.error("Discord post failed for every webhook")
+        return succeeded > 0
+
+    def post(self, image_path: Path, text: str) -> bool:
+        """Post an image and text to Discord via every configured webhook.
+
+        The first webhook receives the image as a file upload; the others
+        reference the uploaded attachment by URL.
+        """
+        try:
+            return self._broadcast([image_path], text)
         except Exception as e:
             logger.error(f"Error posting to Discord: {e}")
             return False
+
+    def post_album(self, image_paths: List[Path], text: str) -> bool:
+        """Post up to 10 images in a single message per webhook."""
+        try:
+            return self._broadcast(image_paths[:10], text)
+        except Exception as e:
+            logger.error(f"Error posting album to Discord: {e}")
+            return False
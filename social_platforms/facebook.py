@@ -1,56 +1,180 @@
-"""Facebook platform integration for posting photos to a Facebook Page.
+"""Facebook platform integration for posting photos to Facebook Pages.
 
-This posts photos to a Page using a Page access token. It uploads the
-local image file directly to the Graph API endpoint.
+This posts photos to one or more Pages using Page access tokens. It uploads
+the local image file directly to the Graph API endpoint.
+
+Pages come from FB_PAGE_ID/FB_PAGE_ACCESS_TOKEN, FB_PAGES ("id:token"
+pairs, comma-separated) and FB_PAGES_FILE (one "id:token" pair per line).
+With several Pages, the photo posts are packed into Graph API batch requests
+(up to FB_BATCH_SIZE operations each) that share a single attached copy of
+the image, and each Page's result is read from the batch response.
 """
 
 import os
+import json
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import requests
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_pages(spec: str) -> List[Tuple[str, str]]:
+    pages = []
+    for item in spec.replace('\n', ',').split(','):
+        item = item.strip()
+        if not item or item.startswith('#'):
+            continue
+        page_id, sep, token = item.partition(':')
+        if not sep or not token:
+            raise ValueError(f"Invalid Facebook page entry (expected id:token): {page_id}")
+        pages.append((page_id.strip(), token.strip()))
+    return pages
+
+
+def _load_pages() -> List[Tuple[str, str]]:
+    """Collect (page_id, page_access_token) pairs from the environment."""
+    pages = []
+    if os.getenv('FB_PAGE_ID') and os.getenv('FB_PAGE_ACCESS_TOKEN'):
+        pages.append((os.getenv('FB_PAGE_ID'), os.getenv('FB_PAGE_ACCESS_TOKEN')))
+    pages.extend(_parse_pages(os.getenv('FB_PAGES', '')))
+    pages_file = os.getenv('FB_PAGES_FILE')
+    if pages_file:
+        with open(pages_file, 'r', encoding='utf-8') as f:
+            pages.extend(_parse_pages(f.read()))
+    return list(dict(pages).items())
+
+
 class FacebookPoster:
-    """Handler for posting images to a Facebook Page via Graph API."""
+    """Handler for posting images to Facebook Pages via Graph API."""
 
     platform_name = "Facebook"
 
     def __init__(self):
-        self.page_id = os.getenv('FB_PAGE_ID')
-        self.page_access_token = os.getenv('FB_PAGE_ACCESS_TOKEN')
+        self.pages = _load_pages()
 
-        if not self.page_id or not self.page_access_token:
+        if not self.pages:
             raise ValueError("Missing FB_PAGE_ID or FB_PAGE_ACCESS_TOKEN environment variables")
 
+        self.page_id, self.page_access_token = self.pages[0]
+
         # Optionally allow specifying a Graph API version
         self.graph_version = os.getenv('FB_GRAPH_VERSION', 'v17.0')
         self.base_url = f"https://graph.facebook.com/{self.graph_version}"
+        # The Graph API accepts at most 50 operations per batch
+        self.batch_size = max(1, min(50, int(os.getenv('FB_BATCH_SIZE', '50'))))
+        self.session = requests.Session()
 
-    def post(self, image_path: Path, text: str) -> bool:
-        """Upload a photo to the configured Facebook Page with a caption.
+    def _post_single(self, image_path: Path, text: str) -> bool:
+        """Upload a photo to the first configured Page with a caption.
 
         Uses the Page's access token. The image is uploaded as multipart
         form data to the /{page_id}/photos endpoint.
         """
+        url = f"{self.base_url}/{self.page_id}/photos"
+        params = {'access_token': self.page_access_token}
+
+        with open(image_path, 'rb') as img_file:
+            files = {'source': (image_path.name, img_file)}
+            data = {'caption': text}
+            resp = self.session.post(url, params=params, data=data, files=files, timeout=60)
+
+        if resp.status_code in (200, 201):
+            logger.info("Successfully posted photo to Facebook Page")
+            return True
+        else:
+            logger.error(f"Facebook Graph API returned {resp.status_code}: {resp.text}")
+            return False
+
+    def _post_batch(self, pages: List[Tuple[str, str]], image_path: Path, text: str) -> Dict[str, dict]:
+        """Post the photo to several Pages in one batch request.
+
+        Returns:
+            Mapping of page id to its result: {'code', 'body'} for processed
+            operations, or {'code': None} for operations Facebook did not run
+        """
+        batch = [
+            {
+                'method': 'POST',
+                'relative_url': f"{page_id}/photos",
+                'body': urlencode({'caption': text, 'access_token': token}),
+                'attached_files': 'source',
+            }
+            for page_id, token in pages
+        ]
+
+        with open(image_path, 'rb') as img_file:
+            files = {'source': (image_path.name, img_file)}
+            data = {'batch': json.dumps(batch), 'include_headers': 'false'}
+            resp = self.session.post(f"{self.base_url}/", params={'access_token': pages[0][1]},
+                                     data=data, files=files, timeout=120)
+
+        if resp.status_code != 200:
+            logger.error(f"Facebook batch request returned {resp.status_code}: {resp.text}")
+            return {page_id: {'code': resp.status_code, 'body': resp.text} for page_id, _ in pages}
+
         try:
-            url = f"{self.base_url}/{self.page_id}/photos"
-            params = {'access_token': self.page_access_token}
+            items = resp.json()
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            logger.error(f"Unexpected Facebook batch response: {resp.text[:500]}")
+            items = []
+        elif len(items) != len(pages):
+            logger.warning(f"Facebook batch returned {len(items)} results for {len(pages)} Pages")
+
+        results = {}
+        for index, (page_id, _) in enumerate(pages):
+            item = items[index] if index < len(items) else None
+            if not isinstance(item, dict):
+                # Not processed (batch timeout) or missing; eligible for a retry
+                results[page_id] = {'code': None}
+                continue
+            try:
+                body = json.loads(item.get('body') or '{}')
+            except ValueError:
+                body = item.get('body')
+            results[page_id] = {'code': item.get('code'), 'body': body}
+        return results
+
+    def post_to_pages(self, image_path: Path, text: str) -> Dict[str, dict]:
+        """Post to every configured Page using batch requests.
 
-            with open(image_path, 'rb') as img_file:
-                files = {'source': (image_path.name, img_file)}
-                data = {'caption': text}
-                resp = requests.post(url, params=params, data=data, files=files, timeout=60)
+        Returns:
+            Mapping of page id to its batch result
+        """
+        results: Dict[str, dict] = {}
+        pending = list(self.pages)
+
+        # One retry for operations the batch did not get to
+        for attempt in range(2):
+            for start in range(0, len(pending), self.batch_size):
+                results.update(self._post_batch(pending[start:start + self.batch_size], image_path, text))
+            pending = [(page_id, token) for page_id, token in pending if results[page_id]['code'] is None]
+            if not pending:
+                break
 
-            if resp.status_code in (200, 201):
-                logger.info("Successfully posted photo to Facebook Page")
-                return True
+        for page_id, result in results.items():
+            if result['code'] in (200, 201):
+                post_id = result['body'].get('id') if isinstance(result['body'], dict) else None
+                logger.info(f"Posted photo to Facebook Page {page_id}: {post_id}")
             else:
-                logger.error(f"Facebook Graph API returned {resp.status_code}: {resp.text}")
-                return False
+                logger.error(f"Facebook Page {page_id} failed ({result['code']}): {result.get('body')}")
+        return results
+
+    def post(self, image_path: Path, text: str) -> bool:
+        """Upload a photo with a caption to every configured Facebook Page."""
+        try:
+            if len(self.pages) == 1:
+                return self._post_single(image_path, text)
+
+            results = self.post_to_pages(image_path, text)
+            succeeded = sum(r['code'] in (200, 201) for r in results.values())
+            logger.info(f"Facebook batch complete: {succeeded}/{len(self.pages)} Pages")
+            return succeeded > 0
 
         except Exception as e:
             logger.error(f"Error posting to Facebook: {e}")
@@ -3,22 +3,32 @@
 Instagram Graph API requires publicly accessible media URLs. This implementation:
 1. Uploads the local image to a hosting service (S3/Imgur) to get a public URL
 2. Creates an Instagram media container with that URL
-3. Publishes the container to make the post live
+3. Polls the container's status_code until it is FINISHED
+4. Publishes the container to make the post live
 
 Environment variables:
 - INSTAGRAM_BUSINESS_ACCOUNT_ID: Instagram Business/Creator account ID
+  (comma-separated for several accounts sharing FB_PAGE_ACCESS_TOKEN)
 - FB_PAGE_ACCESS_TOKEN: Page access token with Instagram permissions
+- INSTAGRAM_ACCOUNTS: Optional "account_id:token" pairs, comma-separated
 - MEDIA_HOSTING_PROVIDER: 's3' or 'imgur' (default: 'imgur')
 
 For S3: AWS_S3_BUCKET, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION
 For Imgur: IMGUR_CLIENT_ID
+
+With several accounts, the image is hosted once, containers for all accounts
+are created concurrently, and a single loop polls every pending container
+(one multi-id Graph request per token) and hands finished ones to the worker
+pool for publishing, so no worker blocks in sleep.
 """
 
 import os
+import heapq
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import requests
 from media_hosting import get_media_host, MediaHostingError
@@ -26,63 +36,92 @@ from media_hosting import get_media_host, MediaHostingError
 logger = logging.getLogger(__name__)
 
 
+def _load_accounts() -> List[Tuple[str, str]]:
+    """Collect (account_id, access_token) pairs from the environment."""
+    accounts = []
+    token = os.getenv('FB_PAGE_ACCESS_TOKEN')
+    if token:
+        accounts.extend(
+            (account_id.strip(), token)
+            for account_id in os.getenv('INSTAGRAM_BUSINESS_ACCOUNT_ID', '').split(',') if account_id.strip()
+        )
+    for item in os.getenv('INSTAGRAM_ACCOUNTS', '').split(','):
+        account_id, sep, account_token = item.strip().partition(':')
+        if sep and account_id and account_token:
+            accounts.append((account_id.strip(), account_token.strip()))
+    return list(dict(accounts).items())
+
+
 class InstagramPoster:
     """Handler for posting images to Instagram via Graph API."""
 
     platform_name = "Instagram"
 
     def __init__(self):
-        self.business_account_id = os.getenv('INSTAGRAM_BUSINESS_ACCOUNT_ID')
-        self.access_token = os.getenv('FB_PAGE_ACCESS_TOKEN')
-        
-        if not self.business_account_id or not self.access_token:
+        self.accounts = _load_accounts()
+
+        if not self.accounts:
             raise ValueError("Missing INSTAGRAM_BUSINESS_ACCOUNT_ID or FB_PAGE_ACCESS_TOKEN environment variables")
-        
+
+        self.business_account_id, self.access_token = self.accounts[0]
         self.graph_version = os.getenv('FB_GRAPH_VERSION', 'v17.0')
         self.base_url = f"https://graph.facebook.com/{self.graph_version}"
-        
+        self.session = requests.Session()
+
+        # Container status polling: start fast, back off, give up at the deadline
+        self.poll_initial = float(os.getenv('INSTAGRAM_POLL_INITIAL', '0.5'))
+        self.poll_max = float(os.getenv('INSTAGRAM_POLL_MAX', '5'))
+        self.publish_timeout = float(os.getenv('INSTAGRAM_PUBLISH_TIMEOUT', '120'))
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv('INSTAGRAM_CONCURRENCY', '8')),
+                                            thread_name_prefix='instagram')
+
         # Initialize media hosting
         try:
             self.media_host = get_media_host()
         except MediaHostingError as e:
             raise ValueError(f"Media hosting setup failed: {e}")
 
-    def _create_container(self, image_url: str, caption: str) -> Optional[str]:
-        """Create an Instagram media container."""
-        url = f"{self.base_url}/{self.business_account_id}/media"
-        params = {
-            'access_token': self.access_token,
-            'image_url': image_url,
-            'caption': caption
-        }
-        
+    def _create_container(self, image_url: Optional[str], caption: Optional[str],
+                          extra: Optional[dict] = None,
+                          account: Optional[Tuple[str, str]] = None) -> Optional[str]:
+        """Create an Instagram media container (image, carousel item or carousel)."""
+        account_id, token = account or self.accounts[0]
+        url = f"{self.base_url}/{account_id}/media"
+        params = {'access_token': token}
+        if image_url:
+            params['image_url'] = image_url
+        if caption:
+            params['caption'] = caption
+        params.update(extra or {})
+
         try:
-            resp = requests.post(url, params=params, timeout=30)
-            
+            resp = self.session.post(url, params=params, timeout=30)
+
             if resp.status_code not in (200, 201):
                 logger.error(f"Instagram container creation failed {resp.status_code}: {resp.text}")
                 return None
-            
+
             data = resp.json()
             container_id = data.get('id')
             logger.info(f"Instagram container created: {container_id}")
             return container_id
-            
+
         except Exception as e:
             logger.error(f"Error creating Instagram container: {e}")
             return None
 
-    def _publish_container(self, container_id: str) -> bool:
+    def _publish_container(self, container_id: str, account: Optional[Tuple[str, str]] = None) -> bool:
         """Publish the Instagram media container."""
-        url = f"{self.base_url}/{self.business_account_id}/media_publish"
+        account_id, token = account or self.accounts[0]
+        url = f"{self.base_url}/{account_id}/media_publish"
         params = {
-            'access_token': self.access_token,
+            'access_token': token,
             'creation_id': container_id
         }
-        
+
         try:
-            resp = requests.post(url, params=params, timeout=30)
-            
+            resp = self.session.post(url, params=params, timeout=30)
+
             if resp.status_code in (200, 201):
                 data = resp.json()
                 post_id = data.get('id')
@@ -91,34 +130,157 @@ class InstagramPoster:
             else:
                 logger.error(f"Instagram publish failed {resp.status_code}: {resp.text}")
                 return False
-                
+
         except Exception as e:
             logger.error(f"Error publishing Instagram container: {e}")
             return False
 
+    def _container_statuses(self, container_ids: List[str], token: str) -> Dict[str, Optional[str]]:
+        """Fetch status_code for several containers in one multi-id request."""
+        try:
+            resp = self.session.get(
+                f"{self.base_url}/",
+                params={'ids': ','.join(container_ids), 'fields': 'status_code', 'access_token': token},
+                timeout=30
+            )
+            if resp.status_code != 200:
+                logger.warning(f"Instagram status check returned {resp.status_code}: {resp.text}")
+                return {}
+            return {cid: (data or {}).get('status_code') for cid, data in resp.json().items()}
+        except Exception as e:
+            logger.warning(f"Error checking Instagram container status: {e}")
+            return {}
+
+    def _publish_when_ready(self, containers: Dict[str, Tuple[str, str]]) -> Dict[str, bool]:
+        """Poll containers until FINISHED and publish them.
+
+        Args:
+            containers: Mapping of account id to (container id, access token)
+
+        Returns:
+            Mapping of account id to whether its post was published
+        """
+        start = time.monotonic()
+        deadline = start + self.publish_timeout
+        delays = {account_id: self.poll_initial for account_id in containers}
+        queue = [(start + self.poll_initial, account_id) for account_id in containers]
+        heapq.heapify(queue)
+        publishing = {}
+        results = {}
+
+        while queue:
+            time.sleep(max(0.0, queue[0][0] - time.monotonic()))
+            now = time.monotonic()
+
+            # Every container that is due is checked in one request per token
+            due = []
+            while queue and queue[0][0] <= now:
+                due.append(heapq.heappop(queue)[1])
+            by_token: Dict[str, List[str]] = {}
+            for account_id in due:
+                container_id, token = containers[account_id]
+                by_token.setdefault(token, []).append(container_id)
+            statuses = {}
+            for token, container_ids in by_token.items():
+                statuses.update(self._container_statuses(container_ids, token))
+
+            for account_id in due:
+                container_id, token = containers[account_id]
+                status = statuses.get(container_id)
+                if status == 'FINISHED':
+                    logger.info(f"Instagram container {container_id} ready after {now - start:.1f}s")
+                    publishing[account_id] = self._executor.submit(
+                        self._publish_container, container_id, (account_id, token)
+                    )
+                elif status in ('ERROR', 'EXPIRED'):
+                    logger.error(f"Instagram container {container_id} for {account_id} failed: {status}")
+                    results[account_id] = False
+                else:
+                    delays[account_id] = min(delays[account_id] * 1.5, self.poll_max)
+                    if now >= deadline:
+                        logger.error(f"Instagram container {container_id} not ready after "
+                                     f"{self.publish_timeout:.0f}s (status: {status})")
+                        results[account_id] = False
+                    else:
+                        heapq.heappush(queue, (min(now + delays[account_id], deadline), account_id))
+
+        for account_id, future in publishing.items():
+            results[account_id] = future.result()
+        return results
+
+    def _publish_all(self, create) -> bool:
+        """Create containers for every account concurrently, then publish as they become ready."""
+        futures = {
+            account[0]: self._executor.submit(create, account)
+            for account in self.accounts
+        }
+        containers = {}
+        for (account_id, token), future in zip(self.accounts, futures.values()):
+            container_id = future.result()
+            if container_id:
+                containers[account_id] = (container_id, token)
+
+        if not containers:
+            return False
+
+        logger.info("Waiting for Instagram containers to finish processing...")
+        results = self._publish_when_ready(containers)
+        succeeded = sum(results.values())
+        if len(self.accounts) > 1:
+            logger.info(f"Instagram published to {succeeded}/{len(self.accounts)} accounts")
+        return succeeded > 0
+
     def post(self, image_path: Path, text: str) -> bool:
         """Post image to Instagram using the container + publish flow."""
         try:
             # Step 1: Upload image to hosting service to get public URL
             logger.info(f"Uploading {image_path.name} to hosting service...")
             image_url = self.media_host.upload_image(image_path)
-            
-            # Step 2: Create Instagram container
+
+            # Steps 2-4: Create containers, wait until processed, publish
             logger.info("Creating Instagram container...")
-            container_id = self._create_container(image_url, text)
-            if not container_id:
-                return False
-            
-            # Step 3: Wait a moment for container processing
-            time.sleep(2)
-            
-            # Step 4: Publish the container
-            logger.info("Publishing Instagram container...")
-            return self._publish_container(container_id)
-            
+            return self._publish_all(lambda account: self._create_container(image_url, text, account=account))
+
         except MediaHostingError as e:
             logger.error(f"Media hosting error: {e}")
             return False
         except Exception as e:
             logger.error(f"Instagram posting error: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def _create_carousel(self, image_urls: List[str], text: str, account: Tuple[str, str]) -> Optional[str]:
+        """Create carousel item containers concurrently, then the carousel container."""
+        # A separate pool: this runs on a shared worker, which must not wait on its own pool
+        with ThreadPoolExecutor(max_workers=len(image_urls)) as executor:
+            children = list(executor.map(
+                lambda u: self._create_container(u, None, {'is_carousel_item': 'true'}, account=account), image_urls
+            ))
+        if not all(children):
+            return None
+
+        return self._create_container(None, text, {
+            'media_type': 'CAROUSEL',
+            'children': ','.join(children)
+        }, account=account)
+
+    def post_album(self, image_paths: List[Path], text: str) -> bool:
+        """Post up to 10 images as a carousel.
+
+        Images are hosted and their carousel item containers created
+        concurrently, then a single carousel container is published.
+        """
+        try:
+            image_paths = image_paths[:10]
+            logger.info(f"Uploading {len(image_paths)} images to hosting service...")
+            with ThreadPoolExecutor(max_workers=len(image_paths)) as executor:
+                image_urls = list(executor.map(self.media_host.upload_image, image_paths))
+
+            logger.info("Creating Instagram carousel containers...")
+            return self._publish_all(lambda account: self._create_carousel(image_urls, text, account))
+
+        except MediaHostingError as e:
+            logger.error(f"Media hosting error: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Instagram carousel error: {e}")
+            return False
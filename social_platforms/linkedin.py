@@ -4,20 +4,27 @@ This implements the registerUpload -> upload -> create UGC post flow.
 Requires:
   - LINKEDIN_ACCESS_TOKEN: OAuth2 access token with w_member_social (or rw_organization_admin) scope
   - LINKEDIN_OWNER_URN: Owner URN, e.g. 'urn:li:person:xxxx' or 'urn:li:organization:yyyy'
+    (comma-separated to post as several owners concurrently)
 
 Notes:
   - Organization posting requires a token authorized for that organization and the owner URN must be the organization URN.
   - The upload URL returned by LinkedIn may accept a direct PUT of the binary image.
   - See: https://learn.microsoft.com/en-us/linkedin/marketing/integrations/community-management/shares/vector-upload
+  - Asset URNs and upload progress are cached per owner and content hash
+    (CACHE_DIR/linkedin_assets.json). A repeat post goes straight to ugcPosts,
+    and a post interrupted after registerUpload resumes at the upload step.
 """
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 import mimetypes
 import requests
 
+from content_cache import JsonStore, content_hash, get_cache_dir
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,9 +35,10 @@ class LinkedInPoster:
 
     def __init__(self):
         self.access_token = os.getenv('LINKEDIN_ACCESS_TOKEN')
-        self.owner_urn = os.getenv('LINKEDIN_OWNER_URN')
-        if not self.access_token or not self.owner_urn:
+        self.owner_urns = [u.strip() for u in os.getenv('LINKEDIN_OWNER_URN', '').split(',') if u.strip()]
+        if not self.access_token or not self.owner_urns:
             raise ValueError("Missing LINKEDIN_ACCESS_TOKEN or LINKEDIN_OWNER_URN environment variables")
+        self.owner_urn = self.owner_urns[0]
 
         self.base_url = os.getenv('LINKEDIN_API_BASE_URL', 'https://api.linkedin.com')
         # Recommended header per LinkedIn docs
@@ -38,12 +46,16 @@ class LinkedInPoster:
             'Authorization': f'Bearer {self.access_token}',
             'X-Restli-Protocol-Version': '2.0.0'
         }
+        self.session = requests.Session()
+
+        ttl_days = float(os.getenv('LINKEDIN_ASSET_TTL_DAYS', '30'))
+        self.assets = JsonStore(get_cache_dir() / 'linkedin_assets.json', ttl=ttl_days * 86400)
 
-    def _register_upload(self) -> Optional[dict]:
+    def _register_upload(self, owner_urn: Optional[str] = None) -> Optional[dict]:
         url = f"{self.base_url}/v2/assets?action=registerUpload"
         payload = {
             "registerUploadRequest": {
-                "owner": self.owner_urn,
+                "owner": owner_urn or self.owner_urn,
                 "recipes": ["urn:li:digitalmediaRecipe:feedshare-image"],
                 "serviceRelationships": [
                     {
@@ -54,7 +66,7 @@ class LinkedInPoster:
             }
         }
 
-        resp = requests.post(url, json=payload, headers={**self.headers, 'Content-Type': 'application/json'}, timeout=30)
+        resp = self.session.post(url, json=payload, headers={**self.headers, 'Content-Type': 'application/json'}, timeout=30)
         if resp.status_code not in (200, 201):
             logger.error(f"LinkedIn registerUpload failed {resp.status_code}: {resp.text}")
             return None
@@ -68,8 +80,11 @@ class LinkedInPoster:
 
         try:
             with open(image_path, 'rb') as f:
-                # LinkedIn upload URL typically expects a PUT of the raw bytes
-                resp = requests.put(upload_url, data=f.read(), headers={'Content-Type': mime_type}, timeout=60)
+                # LinkedIn upload URL expects a PUT of the raw bytes; stream them from the file
+                resp = self.session.put(upload_url, data=f, headers={
+                    'Authorization': f'Bearer {self.access_token}',
+                    'Content-Type': mime_type
+                }, timeout=60)
 
             if resp.status_code not in (200, 201):
                 logger.error(f"LinkedIn binary upload failed {resp.status_code}: {resp.text}")
@@ -81,10 +96,26 @@ class LinkedInPoster:
             logger.error(f"Error uploading binary to LinkedIn: {e}")
             return False
 
-    def _create_ugc_post(self, asset_urn: str, text: str) -> bool:
+    def _create_ugc_post(self, asset_urn: str, text: str, owner_urn: Optional[str] = None) -> bool:
+        return self._create(asset_urn, text, owner_urn)[0]
+
+    @staticmethod
+    def _is_asset_error(resp: requests.Response, asset_urn: str) -> bool:
+        """Return True if a rejected post blames the referenced asset (missing, expired, not ready)."""
+        if resp.status_code not in (400, 404, 422):
+            return False
+        body = resp.text.lower()
+        return asset_urn.lower() in body or 'digitalmediaasset' in body or '/media/0/media' in body
+
+    def _create(self, asset_urn: str, text: str, owner_urn: Optional[str] = None) -> Tuple[bool, bool]:
+        """Create a UGC post.
+
+        Returns:
+            Tuple of (created, whether the failure was caused by the asset)
+        """
         url = f"{self.base_url}/v2/ugcPosts"
         body = {
-            "author": self.owner_urn,
+            "author": owner_urn or self.owner_urn,
             "lifecycleState": "PUBLISHED",
             "specificContent": {
                 "com.linkedin.ugc.ShareContent": {
@@ -103,46 +134,106 @@ class LinkedInPoster:
             "visibility": {"com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"}
         }
 
-        resp = requests.post(url, json=body, headers={**self.headers, 'Content-Type': 'application/json'}, timeout=30)
+        resp = self.session.post(url, json=body, headers={**self.headers, 'Content-Type': 'application/json'}, timeout=30)
         if resp.status_code not in (201, 200):
             logger.error(f"LinkedIn ugcPosts create failed {resp.status_code}: {resp.text}")
-            return False
+            return False, self._is_asset_error(resp, asset_urn)
 
-        return True
+        return True, False
 
-    def post(self, image_path: Path, text: str) -> bool:
-        try:
-            register_value = self._register_upload()
-            if not register_value:
-                return False
+    def _register(self, owner_urn: str) -> Optional[dict]:
+        """Register an upload and return {'asset', 'upload_url'}."""
+        register_value = self._register_upload(owner_urn)
+        if not register_value:
+            return None
 
-            # Extract asset URN and upload URL
-            asset = register_value.get('asset')
-            upload_mech = register_value.get('uploadMechanism', {})
-            # Different key depending on response; try common one
-            upload_info = None
-            for key in upload_mech:
-                upload_info = upload_mech.get(key)
-                if upload_info:
-                    break
-
-            upload_url = None
+        # Extract asset URN and upload URL
+        asset = register_value.get('asset')
+        upload_mech = register_value.get('uploadMechanism', {})
+        # Different key depending on response; try common one
+        upload_info = None
+        for key in upload_mech:
+            upload_info = upload_mech.get(key)
             if upload_info:
-                upload_url = upload_info.get('uploadUrl') or upload_info.get('uploadUrls')
+                break
 
-            if isinstance(upload_url, list):
-                upload_url = upload_url[0]
+        upload_url = None
+        if upload_info:
+            upload_url = upload_info.get('uploadUrl') or upload_info.get('uploadUrls')
 
-            if not asset or not upload_url:
-                logger.error(f"Invalid registerUpload response: asset={asset} upload_url={upload_url}")
-                return False
+        if isinstance(upload_url, list):
+            upload_url = upload_url[0]
+
+        if not asset or not upload_url:
+            logger.error(f"Invalid registerUpload response: asset={asset} upload_url={upload_url}")
+            return None
+
+        return {'asset': asset, 'upload_url': upload_url}
 
-            # Upload binary
-            if not self._upload_binary(upload_url, image_path):
+    def _asset_for(self, image_path: Path, owner_urn: str) -> Optional[str]:
+        """Return an uploaded asset URN for the image, resuming cached progress."""
+        key = f"{owner_urn}:{content_hash(image_path)}"
+        state = self.assets.get(key)
+
+        if state and state.get('stage') == 'uploaded':
+            logger.info(f"Reusing LinkedIn asset {state['asset']} for {image_path.name}")
+            return state['asset']
+
+        if state and state.get('stage') == 'registered':
+            logger.info(f"Resuming LinkedIn upload of {state['asset']}")
+            if not self._upload_binary(state['upload_url'], image_path):
+                # The upload URL may have expired; register again
+                state = None
+        else:
+            state = None
+
+        if state is None:
+            registered = self._register(owner_urn)
+            if not registered:
+                return None
+            state = {**registered, 'stage': 'registered'}
+            self.assets.set(key, state)
+
+            if not self._upload_binary(state['upload_url'], image_path):
+                return None
+
+        state['stage'] = 'uploaded'
+        self.assets.set(key, state)
+        return state['asset']
+
+    def _post_as(self, owner_urn: str, image_path: Path, text: str) -> bool:
+        try:
+            key = f"{owner_urn}:{content_hash(image_path)}"
+            reused = (self.assets.get(key) or {}).get('stage') == 'uploaded'
+            asset = self._asset_for(image_path, owner_urn)
+            if not asset:
                 return False
 
             # Create post referencing the asset URN
-            return self._create_ugc_post(asset, text)
+            created, asset_error = self._create(asset, text, owner_urn)
+            if created or not (reused and asset_error):
+                return created
+
+            # The cached asset is no longer usable; upload afresh once
+            logger.info(f"Cached LinkedIn asset {asset} was rejected, uploading again")
+            self.assets.delete(key)
+            asset = self._asset_for(image_path, owner_urn)
+            return bool(asset) and self._create_ugc_post(asset, text, owner_urn)
+
+        except Exception as e:
+            logger.error(f"Error posting to LinkedIn as {owner_urn}: {e}")
+            return False
+
+    def post(self, image_path: Path, text: str) -> bool:
+        try:
+            if len(self.owner_urns) == 1:
+                return self._post_as(self.owner_urn, image_path, text)
+
+            # Each owner needs its own asset; run the owners concurrently
+            with ThreadPoolExecutor(max_workers=min(8, len(self.owner_urns))) as executor:
+                results = list(executor.map(lambda urn: self._post_as(urn, image_path, text), self.owner_urns))
+            logger.info(f"LinkedIn posted as {sum(results)}/{len(self.owner_urns)} owners")
+            return any(results)
 
         except Exception as e:
             logger.error(f"Error posting to LinkedIn: {e}")
@@ -1,12 +1,21 @@
-"""Reddit platform integration."""
+"""Reddit platform integration.
+
+REDDIT_SUBREDDIT may list several subreddits. The image is uploaded once to
+the first one and the resulting submission is crossposted to the others one
+at a time, paced by REDDIT_CROSSPOST_RATE. Crossposts are not sent from worker
+threads because a praw instance must not be shared between threads.
+"""
 
 import os
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 import praw
 
+from captions import caption_title
+from rate_limit import RateLimiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,7 +31,13 @@ class RedditPoster:
         self.username = os.getenv('REDDIT_USERNAME')
         self.password = os.getenv('REDDIT_PASSWORD')
         self.user_agent = os.getenv('REDDIT_USER_AGENT', 'LainSocialBot/1.0')
-        self.subreddit_name = os.getenv('REDDIT_SUBREDDIT', 'test')
+        self.subreddit_names = [
+            name.strip().removeprefix('r/')
+            for name in os.getenv('REDDIT_SUBREDDIT', 'test').split(',') if name.strip()
+        ]
+        self.subreddit_name = self.subreddit_names[0]
+        self.flair_text = os.getenv('REDDIT_FLAIR_TEXT')
+        self.crosspost_limiter = RateLimiter(float(os.getenv('REDDIT_CROSSPOST_RATE', '0.5')))
 
         if not all([self.client_id, self.client_secret, self.username, self.password]):
             raise ValueError("Missing Reddit API credentials")
@@ -35,6 +50,56 @@ class RedditPoster:
             user_agent=self.user_agent
         )
 
+        self._subreddits: Dict[str, 'praw.models.Subreddit'] = {}
+        self._flair_ids: Dict[str, Optional[str]] = {}
+
+    def _subreddit(self, name: str):
+        """Return a cached subreddit object."""
+        if name not in self._subreddits:
+            self._subreddits[name] = self.reddit.subreddit(name)
+        return self._subreddits[name]
+
+    def _flair_id(self, name: str) -> Optional[str]:
+        """Return the link flair template matching REDDIT_FLAIR_TEXT, looked up once per subreddit."""
+        if not self.flair_text:
+            return None
+        if name in self._flair_ids:
+            return self._flair_ids[name]
+
+        flair_id = None
+        try:
+            for template in self._subreddit(name).flair.link_templates.user_selectable():
+                if template.get('flair_text', '').lower() == self.flair_text.lower():
+                    flair_id = template.get('flair_template_id')
+                    break
+        except Exception as e:
+            logger.warning(f"Could not load flair templates for r/{name}: {e}")
+
+        self._flair_ids[name] = flair_id
+        return flair_id
+
+    def _flair_args(self, name: str) -> dict:
+        flair_id = self._flair_id(name)
+        return {'flair_id': flair_id, 'flair_text': self.flair_text} if flair_id else {}
+
+    def _crosspost(self, submission, name: str) -> bool:
+        self.crosspost_limiter.acquire()
+        try:
+            submission.crosspost(self._subreddit(name), **self._flair_args(name))
+            logger.info(f"Crossposted to r/{name}")
+            return True
+        except Exception as e:
+            logger.error(f"Error crossposting to r/{name}: {e}")
+            return False
+
+    def _fan_out(self, submission):
+        """Crosspost a submission to the remaining subreddits, one at a time."""
+        targets = self.subreddit_names[1:]
+        if not targets:
+            return
+        results = [self._crosspost(submission, name) for name in targets]
+        logger.info(f"Reddit crossposts: {sum(results)}/{len(targets)} succeeded")
+
     def post(self, image_path: Path, text: str) -> bool:
         """Post image with text to Reddit.
         
@@ -46,17 +111,38 @@ class RedditPoster:
             True if successful, False otherwise
         """
         try:
-            subreddit = self.reddit.subreddit(self.subreddit_name)
+            subreddit = self._subreddit(self.subreddit_name)
             
-            # Submit image post
-            subreddit.submit_image(
-                title=text[:300],  # Reddit has a 300 character limit for titles
-                image_path=str(image_path)
+            # Submit image post once; other subreddits get crossposts
+            submission = subreddit.submit_image(
+                title=caption_title(text, 300),  # Reddit has a 300 character limit for titles
+                image_path=str(image_path),
+                **self._flair_args(self.subreddit_name)
             )
             
             logger.info(f"Successfully posted to Reddit (r/{self.subreddit_name})")
+            self._fan_out(submission)
             return True
             
         except Exception as e:
             logger.error(f"Error posting to Reddit: {e}")
             return False
+
+    def post_album(self, image_paths: List[Path], text: str) -> bool:
+        """Post up to 20 images as a Reddit gallery."""
+        try:
+            subreddit = self._subreddit(self.subreddit_name)
+            
+            submission = subreddit.submit_gallery(
+                title=caption_title(text, 300),
+                images=[{'image_path': str(p)} for p in image_paths[:20]],
+                **self._flair_args(self.subreddit_name)
+            )
+            
+            logger.info(f"Successfully posted gallery to Reddit (r/{self.subreddit_name})")
+            self._fan_out(submission)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error posting gallery to Reddit: {e}")
+            return False
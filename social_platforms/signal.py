@@ -1,11 +1,22 @@
-"""Signal integration via signal-cli REST API (placeholder adapter).
+"""Signal integration via signal-cli REST API.
 
-This implementation attempts to send messages using a running
-signal-cli-rest-api instance (https://github.com/bbernhard/signal-cli-rest-api).
+This implementation sends messages using a running signal-cli-rest-api
+instance (https://github.com/bbernhard/signal-cli-rest-api).
 
 Environment variables:
   - SIGNAL_CLI_REST_URL (default: http://localhost:8080)
-  - SIGNAL_RECIPIENT (recipient phone number in international format, e.g. +15551234567)
+  - SIGNAL_NUMBER (registered sender number, required for the /v2/send API)
+  - SIGNAL_RECIPIENT (recipient phone numbers in international format,
+    comma-separated, e.g. +15551234567)
+  - SIGNAL_GROUP_IDS (optional group ids, comma-separated, e.g. group.abc...)
+  - SIGNAL_TIMEOUT (seconds per send request, default: 30)
+
+The API is detected once via /v1/about and cached. When /v2/send is
+available, every recipient and group gets the message from one JSON request
+with the images base64-encoded. Older deployments fall back to the legacy
+multipart endpoints, remembering whichever one worked. The detected API is
+kept for the session; detection is only repeated when signal-cli-rest-api
+cannot be reached.
 
 If you don't run signal-cli-rest-api, this module will log helpful
 instructions instead of sending.
@@ -13,54 +24,154 @@ instructions instead of sending.
 
 import os
 import json
+import base64
 import logging
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import requests
 
 logger = logging.getLogger(__name__)
 
+# Multipart endpoints of older adapters, tried in order
+LEGACY_ENDPOINTS = ['/v1/send', '/v1/messages']
+
 
 class SignalPoster:
     platform_name = "Signal"
 
     def __init__(self):
-        self.api_url = os.getenv('SIGNAL_CLI_REST_URL', 'http://localhost:8080')
-        self.recipient = os.getenv('SIGNAL_RECIPIENT')
-        if not self.recipient:
+        self.api_url = os.getenv('SIGNAL_CLI_REST_URL', 'http://localhost:8080').rstrip('/')
+        self.number = os.getenv('SIGNAL_NUMBER')
+        self.recipients = [r.strip() for r in os.getenv('SIGNAL_RECIPIENT', '').split(',') if r.strip()]
+        self.recipients += [g.strip() for g in os.getenv('SIGNAL_GROUP_IDS', '').split(',') if g.strip()]
+        if not self.recipients:
             raise ValueError("Missing SIGNAL_RECIPIENT environment variable (recipient phone number)")
 
-    def post(self, image_path: Path, text: str) -> bool:
-        """Attempt to send a message with attachment via signal-cli REST API.
+        self.recipient = self.recipients[0]
+        self.timeout = float(os.getenv('SIGNAL_TIMEOUT', '30'))
+        self.session = requests.Session()
 
-        This posts multipart/form-data to /v1/messages or /v1/send depending
-        on the deployed API. We try common endpoints and log helpful
-        instructions if it fails.
-        """
-        # Try the common endpoint /v1/send
-        endpoints = [
-            '/v1/send',
-            '/v1/messages'
-        ]
-
-        for ep in endpoints:
-            url = self.api_url.rstrip('/') + ep
+        # Detected API: 'v2' or a legacy endpoint path; None until known
+        self.endpoint: Optional[str] = None
+        self._about_checked = False
+        self._endpoint_lock = threading.Lock()
+        self._detect_endpoint()
+
+    def _detect_endpoint(self) -> Optional[str]:
+        """Ask the API which versions it supports and pick the send endpoint."""
+        with self._endpoint_lock:
+            self._about_checked = False
             try:
-                with open(image_path, 'rb') as f:
-                    files = {'attachment': (image_path.name, f, 'application/octet-stream')}
-                    data = {'message': text, 'recipients': json.dumps([self.recipient])}
-                    resp = requests.post(url, data=data, files=files, timeout=60)
-
-                if resp.status_code in (200, 201):
-                    logger.info(f"Successfully sent Signal message via {url}")
-                    return True
+                resp = self.session.get(f"{self.api_url}/v1/about", timeout=5)
+                if resp.status_code == 200:
+                    about = resp.json()
+                    self._about_checked = True
+                    versions = about.get('versions') or []
+                    logger.info(f"signal-cli-rest-api {about.get('version', '')} supports {', '.join(versions)}")
+                    if 'v2' in versions and self.number:
+                        self.endpoint = 'v2'
+                        return self.endpoint
+                    if 'v2' in versions:
+                        logger.warning("Set SIGNAL_NUMBER to use the /v2/send API")
                 else:
-                    logger.debug(f"Signal endpoint {url} returned {resp.status_code}: {resp.text}")
+                    logger.debug(f"Signal /v1/about returned {resp.status_code}: {resp.text}")
+            except Exception as e:
+                logger.warning(f"Could not reach signal-cli-rest-api at {self.api_url}: {e}")
+
+            # Legacy endpoints are probed by the next send
+            self.endpoint = None
+            return None
+
+    def _send_v2(self, image_paths: List[Path], text: str) -> bool:
+        """Send to every recipient and group in one /v2/send JSON request."""
+        attachments = [base64.b64encode(p.read_bytes()).decode('ascii') for p in image_paths]
+        payload = {
+            'message': text,
+            'number': self.number,
+            'recipients': self.recipients,
+            'base64_attachments': attachments
+        }
+        resp = self.session.post(f"{self.api_url}/v2/send", json=payload, timeout=self.timeout)
+        if resp.status_code in (200, 201):
+            logger.info(f"Successfully sent Signal message to {len(self.recipients)} recipients")
+            return True
+        logger.error(f"Signal /v2/send returned {resp.status_code}: {resp.text}")
+        return False
+
+    def _send_legacy(self, endpoint: str, image_path: Path, text: str) -> bool:
+        """Send a multipart message with a single attachment to a legacy endpoint."""
+        url = self.api_url + endpoint
+        try:
+            with open(image_path, 'rb') as f:
+                files = {'attachment': (image_path.name, f, 'application/octet-stream')}
+                data = {'message': text, 'recipients': json.dumps(self.recipients)}
+                resp = self.session.post(url, data=data, files=files, timeout=self.timeout)
+
+            if resp.status_code in (200, 201):
+                logger.info(f"Successfully sent Signal message via {url}")
+                return True
+            logger.debug(f"Signal endpoint {url} returned {resp.status_code}: {resp.text}")
+
+        except requests.ConnectionError:
+            raise
+        except Exception as e:
+            logger.debug(f"Signal endpoint {url} request error: {e}")
+        return False
 
+    def _send_with(self, endpoint: Optional[str], image_paths: List[Path], text: str) -> bool:
+        """Send using the detected API, probing the legacy endpoints if none is known.
+
+        Raises:
+            requests.ConnectionError: If signal-cli-rest-api cannot be reached
+        """
+        if endpoint == 'v2':
+            try:
+                return self._send_v2(image_paths, text)
+            except requests.ConnectionError:
+                raise
             except Exception as e:
-                logger.debug(f"Signal endpoint {url} request error: {e}")
+                logger.error(f"Signal /v2/send request error: {e}")
+                return False
+        if endpoint:
+            return self._send_legacy(endpoint, image_paths[0], text)
+
+        for candidate in LEGACY_ENDPOINTS:
+            if self._send_legacy(candidate, image_paths[0], text):
+                self.endpoint = candidate
+                return True
+        return False
+
+    def _send(self, image_paths: List[Path], text: str) -> bool:
+        if self._about_checked or self.endpoint:
+            try:
+                return self._send_with(self.endpoint, image_paths, text)
+            except requests.ConnectionError as e:
+                logger.warning(f"Could not reach signal-cli-rest-api at {self.api_url}: {e}")
+
+        # The API was unreachable: detect again and retry once
+        self._detect_endpoint()
+        try:
+            return self._send_with(self.endpoint, image_paths, text)
+        except requests.ConnectionError as e:
+            logger.error(f"Could not reach signal-cli-rest-api at {self.api_url}: {e}")
+            return False
+
+    def post(self, image_path: Path, text: str) -> bool:
+        """Send a message with attachment via signal-cli REST API.
+
+        Uses /v2/send when available, otherwise the legacy multipart
+        endpoint that last worked, and logs helpful instructions if every
+        attempt fails.
+        """
+        return self.post_album([image_path], text)
+
+    def post_album(self, image_paths: List[Path], text: str) -> bool:
+        """Send several images in one message (legacy endpoints send the first)."""
+        if self._send(image_paths, text):
+            return True
 
         logger.error("Failed to send Signal message. Is signal-cli-rest-api running and reachable? See README notes.")
-        logger.info("Hints: run signal-cli-rest-api locally and set SIGNAL_CLI_REST_URL and SIGNAL_RECIPIENT environment variables.")
+        logger.info("Hints: run signal-cli-rest-api locally and set SIGNAL_CLI_REST_URL, SIGNAL_NUMBER and SIGNAL_RECIPIENT environment variables.")
         return False
@@ -1,16 +1,31 @@
 """Telegram platform integration using Bot API via HTTPS requests.
 
 This implementation uses simple HTTP requests (no extra dependency) to
-send photos via a bot token and chat id.
+send photos via a bot token to one or more chats.
+
+Photos are uploaded once; Telegram returns a file_id that is reused for every
+other chat and cached per content hash (CACHE_DIR/telegram_file_ids.json), so
+later broadcasts of the same image send no image bytes at all. Sends are
+paced to Telegram's global (~30 messages/s) and per-chat limits, and 429
+responses are retried after the requested delay.
 """
 
 import os
+import json
+import time
 import logging
+import threading
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import requests
 
+from broadcast import broadcast, load_targets
+from captions import PHOTO_CAPTION_LIMIT, caption_fit
+from content_cache import JsonStore, content_hash, get_cache_dir
+from rate_limit import RateLimiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,29 +36,149 @@ class TelegramPoster:
 
     def __init__(self):
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
-        self.chat_id = os.getenv('TELEGRAM_CHAT_ID')
+        self.chat_ids = load_targets('TELEGRAM_CHAT_ID', 'TELEGRAM_CHAT_IDS_FILE')
 
-        if not self.token or not self.chat_id:
+        if not self.token or not self.chat_ids:
             raise ValueError("Missing TELEGRAM_BOT_TOKEN or TELEGRAM_CHAT_ID environment variables")
 
+        self.chat_id = self.chat_ids[0]
         self.base_url = f"https://api.telegram.org/bot{self.token}"
+        self.session = requests.Session()
 
-    def post(self, image_path: Path, text: str) -> bool:
-        """Send a photo with caption to the configured chat id."""
-        try:
-            url = f"{self.base_url}/sendPhoto"
-            with open(image_path, 'rb') as img_file:
-                files = {'photo': (image_path.name, img_file)}
-                data = {'chat_id': self.chat_id, 'caption': text}
-                resp = requests.post(url, data=data, files=files, timeout=30)
+        self.concurrency = int(os.getenv('TELEGRAM_CONCURRENCY', '8'))
+        self.global_limiter = RateLimiter(float(os.getenv('TELEGRAM_GLOBAL_RATE', '30')))
+        self._chat_limiters: Dict[str, RateLimiter] = {}
+        self._limiters_lock = threading.Lock()
+
+        # file_ids are only valid for the bot that received them
+        self.bot_id = self.token.split(':', 1)[0]
+        self.file_ids = JsonStore(get_cache_dir() / 'telegram_file_ids.json')
+
+    def _chat_limiter(self, chat_id: str) -> RateLimiter:
+        """Groups and channels allow ~20 messages/minute, private chats ~1/s."""
+        with self._limiters_lock:
+            if chat_id not in self._chat_limiters:
+                rate = 20 / 60 if chat_id.startswith('-') or chat_id.startswith('@') else 1.0
+                self._chat_limiters[chat_id] = RateLimiter(rate, burst=1)
+            return self._chat_limiters[chat_id]
+
+    def _cache_key(self, image_path: Path) -> str:
+        return f"{self.bot_id}:{content_hash(image_path)}"
+
+    def _request(self, method: str, chat_id: str, data: dict, files: Optional[dict] = None,
+                 messages: int = 1) -> Tuple[Optional[dict], int]:
+        """Call a Bot API send method, pacing and retrying on 429.
+
+        Returns:
+            Tuple of (decoded 'result' or None on failure, HTTP status code)
+        """
+        for attempt in range(3):
+            self._chat_limiter(chat_id).acquire()
+            self.global_limiter.acquire(messages)
+
+            if files:
+                # Rewind files when retrying an upload
+                for _, handle in files.values():
+                    handle.seek(0)
+            resp = self.session.post(f"{self.base_url}/{method}", data=data, files=files, timeout=60)
 
             if resp.status_code == 200:
-                logger.info("Successfully posted to Telegram")
+                return resp.json().get('result'), 200
+
+            if resp.status_code == 429:
+                try:
+                    retry_after = resp.json().get('parameters', {}).get('retry_after', 1)
+                except ValueError:
+                    retry_after = 1
+                logger.warning(f"Telegram rate limited for chat {chat_id}, retrying in {retry_after}s")
+                time.sleep(retry_after)
+                continue
+
+            logger.error(f"Telegram API returned {resp.status_code} for chat {chat_id}: {resp.text}")
+            return None, resp.status_code
+        return None, 429
+
+    def _send_photo(self, chat_id: str, image_path: Path, text: str) -> bool:
+        key = self._cache_key(image_path)
+        file_id = self.file_ids.get(key)
+        data = {'chat_id': chat_id, 'caption': caption_fit(text, PHOTO_CAPTION_LIMIT)}
+
+        if file_id:
+            result, status = self._request('sendPhoto', chat_id, {**data, 'photo': file_id})
+            if result is not None:
                 return True
-            else:
-                logger.error(f"Telegram API returned {resp.status_code}: {resp.text}")
+            if status != 400:
                 return False
+            # The file_id was rejected; fall back to uploading
+            self.file_ids.delete(key)
+
+        with open(image_path, 'rb') as img_file:
+            result, _ = self._request('sendPhoto', chat_id, data, files={'photo': (image_path.name, img_file)})
+        if result is None:
+            return False
+
+        sizes = result.get('photo') or []
+        if sizes:
+            self.file_ids.set(key, sizes[-1]['file_id'])
+        return True
+
+    def _send_media_group(self, chat_id: str, image_paths: List[Path], text: str) -> bool:
+        keys = [self._cache_key(p) for p in image_paths]
+        cached = [self.file_ids.get(k) for k in keys]
+
+        media = []
+        for i, file_id in enumerate(cached):
+            item = {'type': 'photo', 'media': file_id or f"attach://photo{i}"}
+            if i == 0:
+                item['caption'] = caption_fit(text, PHOTO_CAPTION_LIMIT)
+            media.append(item)
+
+        with ExitStack() as stack:
+            files = {
+                f"photo{i}": (p.name, stack.enter_context(open(p, 'rb')))
+                for i, (p, file_id) in enumerate(zip(image_paths, cached)) if not file_id
+            }
+            result, status = self._request('sendMediaGroup', chat_id, {'chat_id': chat_id, 'media': json.dumps(media)},
+                                   files=files or None, messages=len(media))
+        if result is None:
+            if status == 400:
+                # A cached file_id may have been rejected; upload again next time
+                for key, file_id in zip(keys, cached):
+                    if file_id:
+                        self.file_ids.delete(key)
+            return False
+
+        for key, file_id, message in zip(keys, cached, result):
+            sizes = message.get('photo') or []
+            if not file_id and sizes:
+                self.file_ids.set(key, sizes[-1]['file_id'])
+        return True
+
+    def _broadcast(self, send) -> bool:
+        """Send to chats until one upload succeeds, then fan out with the file_id."""
+        # The first successful send uploads the bytes and caches the file_id
+        succeeded = broadcast(self.chat_ids, send, self.concurrency, "Telegram chat")
 
+        total = len(self.chat_ids)
+        if succeeded:
+            logger.info(f"Successfully posted to Telegram ({succeeded}/{total} chats)")
+        else:
+            logger.error("Telegram post failed for every chat")
+        return succeeded > 0
+
+    def post(self, image_path: Path, text: str) -> bool:
+        """Send a photo with caption to every configured chat."""
+        try:
+            return self._broadcast(lambda chat_id: self._send_photo(chat_id, image_path, text))
         except Exception as e:
             logger.error(f"Error posting to Telegram: {e}")
             return False
+
+    def post_album(self, image_paths: List[Path], text: str) -> bool:
+        """Send up to 10 photos as one album with sendMediaGroup to every chat."""
+        try:
+            image_paths = image_paths[:10]
+            return self._broadcast(lambda chat_id: self._send_media_group(chat_id, image_paths, text))
+        except Exception as e:
+            logger.error(f"Error posting album to Telegram: {e}")
+            return False
@@ -1,12 +1,24 @@
-"""Twitter/X platform integration."""
+"""Twitter/X platform integration.
+
+Media is sent with chunked INIT/APPEND/FINALIZE uploads. Segments are
+appended in parallel and retried individually; upload progress and media IDs
+are kept in CACHE_DIR/twitter_media.json keyed by content hash, so a failed
+upload resumes where it stopped and a retried tweet reuses the uploaded media.
+"""
 
 import os
+import time
 import logging
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import tweepy
 
+from captions import caption_tweet
+from content_cache import JsonStore, content_hash, get_cache_dir
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,6 +57,123 @@ class TwitterPoster:
             access_token_secret=self.access_token_secret
         )
 
+        self.chunk_size = int(float(os.getenv('TWITTER_CHUNK_SIZE_MB', '4')) * 1024 * 1024)
+        self.upload_concurrency = int(os.getenv('TWITTER_UPLOAD_CONCURRENCY', '3'))
+        self.upload_retries = int(os.getenv('TWITTER_UPLOAD_RETRIES', '3'))
+        self.processing_timeout = float(os.getenv('TWITTER_PROCESSING_TIMEOUT', '300'))
+        # Media IDs expire 24h after INIT; keep a margin
+        self.media_cache = JsonStore(get_cache_dir() / 'twitter_media.json', ttl=23 * 3600)
+
+    @staticmethod
+    def _media_category(media_type: str) -> str:
+        if media_type == 'image/gif':
+            return 'tweet_gif'
+        if media_type.startswith('video/'):
+            return 'tweet_video'
+        return 'tweet_image'
+
+    def _append_segment(self, media_id: str, image_path: Path, index: int):
+        """Upload one segment, retrying with backoff."""
+        with open(image_path, 'rb') as f:
+            f.seek(index * self.chunk_size)
+            data = f.read(self.chunk_size)
+
+        for attempt in range(self.upload_retries):
+            try:
+                self.api_v1.chunked_upload_append(media_id, data, index)
+                return
+            except Exception as e:
+                if attempt == self.upload_retries - 1:
+                    raise
+                logger.warning(f"Twitter APPEND segment {index} failed ({e}), retrying")
+                time.sleep(2 ** attempt)
+
+    def _wait_for_processing(self, media_id: str, processing_info: Optional[dict]):
+        """Poll STATUS until asynchronous media processing finishes."""
+        deadline = time.monotonic() + self.processing_timeout
+        while processing_info:
+            state = processing_info.get('state')
+            if state == 'succeeded':
+                return
+            if state == 'failed':
+                raise RuntimeError(f"Twitter media processing failed: {processing_info.get('error')}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Twitter media {media_id} still processing after {self.processing_timeout:.0f}s")
+
+            time.sleep(max(1, processing_info.get('check_after_secs', 1)))
+            status = self.api_v1.get_media_upload_status(media_id)
+            processing_info = getattr(status, 'processing_info', None)
+
+    def upload_media(self, image_path: Path) -> str:
+        """Upload a file with chunked upload, resuming or reusing earlier work.
+
+        Args:
+            image_path: Path to the image, GIF or video
+
+        Returns:
+            Media ID usable in create_tweet
+        """
+        key = content_hash(image_path)
+        state = self.media_cache.get(key)
+        if state and state.get('expires_at', 0) <= time.time() + 60:
+            state = None
+
+        if state and state.get('finalized'):
+            logger.info(f"Reusing Twitter media {state['media_id']} for {image_path.name}")
+            return state['media_id']
+
+        total_bytes = image_path.stat().st_size
+        segments = max(1, -(-total_bytes // self.chunk_size))
+
+        if state:
+            logger.info(f"Resuming Twitter upload {state['media_id']} "
+                        f"({len(state['segments_done'])}/{segments} segments done)")
+        else:
+            media_type = mimetypes.guess_type(str(image_path))[0] or 'image/jpeg'
+            media = self.api_v1.chunked_upload_init(
+                total_bytes, media_type, media_category=self._media_category(media_type)
+            )
+            state = {
+                'media_id': media.media_id_string,
+                'segments_done': [],
+                'finalized': False,
+                'expires_at': time.time() + getattr(media, 'expires_after_secs', 86400)
+            }
+            self.media_cache.set(key, state)
+
+        media_id = state['media_id']
+        missing = [i for i in range(segments) if i not in state['segments_done']]
+
+        def append(index: int):
+            self._append_segment(media_id, image_path, index)
+            return index
+
+        # Record each finished segment so a later attempt only sends the rest
+        with ThreadPoolExecutor(max_workers=max(1, self.upload_concurrency)) as executor:
+            futures = [executor.submit(append, i) for i in missing]
+            error = None
+            for future in futures:
+                try:
+                    state['segments_done'].append(future.result())
+                except Exception as e:
+                    error = error or e
+            self.media_cache.set(key, state)
+            if error:
+                raise error
+
+        try:
+            media = self.api_v1.chunked_upload_finalize(media_id)
+        except Exception:
+            # An unknown or expired upload cannot be resumed; start over next time
+            self.media_cache.delete(key)
+            raise
+        self._wait_for_processing(media_id, getattr(media, 'processing_info', None))
+
+        state['finalized'] = True
+        self.media_cache.set(key, state)
+        logger.info(f"Uploaded {image_path.name} to Twitter in {segments} segment(s)")
+        return media_id
+
     def post(self, image_path: Path, text: str) -> bool:
         """Post image with text to Twitter.
         
@@ -56,13 +185,13 @@ class TwitterPoster:
             True if successful, False otherwise
         """
         try:
-            # Upload media using API v1.1
-            media = self.api_v1.media_upload(filename=str(image_path))
+            # Chunked upload using API v1.1; reuses media from an earlier attempt
+            media_id = self.upload_media(image_path)
             
-            # Create tweet with media using API v2
+            # Create tweet with media using API v2 (tweet variant fits 280 weighted chars)
             self.client.create_tweet(
-                text=text,
-                media_ids=[media.media_id]
+                text=caption_tweet(text),
+                media_ids=[media_id]
             )
             
             logger.info("Successfully posted to Twitter")
@@ -71,3 +200,22 @@ class TwitterPoster:
         except Exception as e:
             logger.error(f"Error posting to Twitter: {e}")
             return False
+
+    def post_album(self, image_paths: List[Path], text: str) -> bool:
+        """Post up to four images in one tweet, uploading them concurrently."""
+        try:
+            image_paths = image_paths[:4]
+            with ThreadPoolExecutor(max_workers=len(image_paths)) as executor:
+                media_ids = list(executor.map(self.upload_media, image_paths))
+            
+            self.client.create_tweet(
+                text=caption_tweet(text),
+                media_ids=media_ids
+            )
+            
+            logger.info(f"Successfully posted {len(media_ids)} images to Twitter")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error posting album to Twitter: {e}")
+            return False
@@ -7,21 +7,53 @@ This module implements sending images via the WhatsApp Cloud API by:
 Environment variables used:
   - WHATSAPP_PHONE_NUMBER_ID: your WhatsApp Business Cloud phone-number-id
   - WHATSAPP_ACCESS_TOKEN: bearer token for the WhatsApp Cloud API
-  - WHATSAPP_TO: destination phone number in international format (e.g. +15551234567)
+  - WHATSAPP_TO: destination phone number(s) in international format
+    (e.g. +15551234567), comma-separated for several recipients
+  - WHATSAPP_TO_FILE: optional file with one recipient number per line
+
+Uploaded media ids stay valid on the Cloud API for 30 days, so they are
+cached per content hash (CACHE_DIR/whatsapp_media.json) and an image is
+uploaded once however many recipients or posts use it. Messages to
+several recipients are sent concurrently within WHATSAPP_MESSAGES_PER_SECOND,
+the phone number's throughput tier.
 
 If you prefer Twilio's WhatsApp messaging API, you'll need a publicly
 accessible media URL; see notes below.
 """
 
 import os
+import time
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 import requests
 
+from broadcast import broadcast, load_targets
+from captions import PHOTO_CAPTION_LIMIT, caption_fit
+from content_cache import JsonStore, content_hash, get_cache_dir
+from rate_limit import RateLimiter
+
 logger = logging.getLogger(__name__)
 
+# Cloud API errors meaning the media itself could not be used
+MEDIA_ERROR_CODES = {131052, 131053}
+# Generic invalid-parameter errors; only media related when they mention it
+PARAMETER_ERROR_CODES = {100, 131008, 131009}
+
+
+def _is_media_error(resp: requests.Response) -> bool:
+    """Return True if a failed send says the media id is invalid or expired."""
+    try:
+        error = resp.json().get('error') or {}
+    except (ValueError, AttributeError):
+        return False
+    code = error.get('code')
+    if code in MEDIA_ERROR_CODES:
+        return True
+    details = ' '.join(str(v) for v in (error.get('message'), error.get('error_data'))).lower()
+    return code in PARAMETER_ERROR_CODES and 'media' in details
+
 
 class WhatsAppPoster:
     platform_name = "WhatsApp"
@@ -29,12 +61,39 @@ class WhatsAppPoster:
     def __init__(self):
         self.phone_number_id = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
         self.access_token = os.getenv('WHATSAPP_ACCESS_TOKEN')
-        self.to = os.getenv('WHATSAPP_TO')
+        self.recipients = load_targets('WHATSAPP_TO', 'WHATSAPP_TO_FILE')
 
-        if not (self.phone_number_id and self.access_token and self.to):
+        if not (self.phone_number_id and self.access_token and self.recipients):
             raise ValueError("Missing WHATSAPP_PHONE_NUMBER_ID, WHATSAPP_ACCESS_TOKEN or WHATSAPP_TO environment variables")
 
+        self.to = self.recipients[0]
         self.base_url = os.getenv('WHATSAPP_API_BASE_URL', 'https://graph.facebook.com')
+        self.session = requests.Session()
+        self.concurrency = int(os.getenv('WHATSAPP_CONCURRENCY', '8'))
+        self.limiter = RateLimiter(float(os.getenv('WHATSAPP_MESSAGES_PER_SECOND', '80')))
+
+        # Media ids expire after 30 days; stop reusing them a little earlier
+        ttl_days = float(os.getenv('WHATSAPP_MEDIA_TTL_DAYS', '29'))
+        self.media_cache = JsonStore(get_cache_dir() / 'whatsapp_media.json', ttl=ttl_days * 86400)
+
+    def _media_key(self, image_path: Path) -> str:
+        return f"{self.phone_number_id}:{content_hash(image_path)}"
+
+    def _media_id(self, image_path: Path, refresh: bool = False) -> Optional[str]:
+        """Return a media id for the image, uploading only if none is cached."""
+        key = self._media_key(image_path)
+        if not refresh:
+            media_id = self.media_cache.get(key)
+            if media_id:
+                logger.info(f"Reusing WhatsApp media {media_id} for {image_path.name}")
+                return media_id
+
+        media_id = self._upload_media(image_path)
+        if media_id:
+            self.media_cache.set(key, media_id)
+        else:
+            self.media_cache.delete(key)
+        return media_id
 
     def _upload_media(self, image_path: Path) -> Optional[str]:
         url = f"{self.base_url}/v17.0/{self.phone_number_id}/media"
@@ -42,7 +101,8 @@ class WhatsAppPoster:
         try:
             with open(image_path, 'rb') as f:
                 files = {'file': (image_path.name, f, 'application/octet-stream')}
-                resp = requests.post(url, headers=headers, files=files, timeout=60)
+                data = {'messaging_product': 'whatsapp'}
+                resp = self.session.post(url, headers=headers, data=data, files=files, timeout=60)
 
             if resp.status_code not in (200, 201):
                 logger.error(f"WhatsApp media upload failed {resp.status_code}: {resp.text}")
@@ -56,7 +116,15 @@ class WhatsAppPoster:
             logger.error(f"Error uploading media to WhatsApp: {e}")
             return None
 
-    def _send_image_message(self, media_id: str, text: str) -> bool:
+    def _send_image_message(self, media_id: str, text: str, to: Optional[str] = None) -> bool:
+        return self._send(media_id, text, to)[0]
+
+    def _send(self, media_id: str, text: str, to: Optional[str] = None) -> Tuple[bool, bool]:
+        """Send an image message.
+
+        Returns:
+            Tuple of (sent, whether the failure was caused by the media id)
+        """
         url = f"{self.base_url}/v17.0/{self.phone_number_id}/messages"
         headers = {
             'Authorization': f'Bearer {self.access_token}',
@@ -64,35 +132,59 @@ class WhatsAppPoster:
         }
         payload = {
             'messaging_product': 'whatsapp',
-            'to': self.to,
+            'to': to or self.to,
             'type': 'image',
             'image': {
                 'id': media_id,
-                'caption': text
+                'caption': caption_fit(text, PHOTO_CAPTION_LIMIT)
             }
         }
 
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=30)
-            if resp.status_code in (200, 201):
-                logger.info("Successfully sent WhatsApp image message")
-                return True
-            else:
+            for attempt in range(3):
+                self.limiter.acquire()
+                resp = self.session.post(url, headers=headers, json=payload, timeout=30)
+                if resp.status_code in (200, 201):
+                    logger.info(f"Successfully sent WhatsApp image message to {payload['to']}")
+                    return True, False
+                if resp.status_code == 429:
+                    # Throughput limit hit; back off and retry
+                    time.sleep(2 ** attempt)
+                    continue
                 logger.error(f"WhatsApp send message failed {resp.status_code}: {resp.text}")
-                return False
+                return False, _is_media_error(resp)
+            logger.error(f"WhatsApp send message to {payload['to']} still rate limited")
+            return False, False
 
         except Exception as e:
             logger.error(f"Error sending WhatsApp message: {e}")
-            return False
+            return False, False
 
     def post(self, image_path: Path, text: str) -> bool:
-        """Upload image and send it via WhatsApp Cloud API."""
+        """Upload image once and send it to every recipient via WhatsApp Cloud API."""
         try:
-            media_id = self._upload_media(image_path)
+            reused = self._media_key(image_path) in self.media_cache
+            media_id = self._media_id(image_path)
             if not media_id:
                 return False
 
-            return self._send_image_message(media_id, text)
+            def send_first(to: str) -> bool:
+                nonlocal media_id, reused
+                sent, media_error = self._send(media_id, text, to)
+                if sent or not (reused and media_error):
+                    return sent
+                # The cached media id expired early; upload again and retry once
+                logger.info(f"Cached WhatsApp media {media_id} was rejected, uploading again")
+                reused = False
+                media_id = self._media_id(image_path, refresh=True)
+                return bool(media_id) and self._send_image_message(media_id, text, to)
+
+            succeeded = broadcast(self.recipients, lambda to: self._send_image_message(media_id, text, to),
+                                  self.concurrency, "WhatsApp recipient", first=send_first)
+            if len(self.recipients) > 1:
+                logger.info(f"WhatsApp broadcast: {succeeded}/{len(self.recipients)} recipients")
+
+            return succeeded > 0
 
         except Exception as e:
             logger.error(f"WhatsApp posting error: {e}")
@@ -9,6 +9,20 @@ Environment variables:
 - YOUTUBE_REFRESH_TOKEN: OAuth2 refresh token for YouTube uploads
 - YOUTUBE_VIDEO_DURATION: Video length in seconds (default: 5)
 - YOUTUBE_AUDIO_FILE: Optional audio file to add to videos
+- YOUTUBE_VIDEO_SCALE: Output size as WIDTH:HEIGHT (default: 1280:720)
+- YOUTUBE_VIDEO_FPS: Output frame rate (default: 2; the picture never moves)
+- YOUTUBE_X264_PRESET: libx264 preset (default: veryfast)
+- YOUTUBE_VIDEO_CACHE_MAX: Rendered videos kept in CACHE_DIR/videos (default: 50)
+- YOUTUBE_UPLOAD_CHUNK_MB: Resumable upload chunk size (default: 8)
+- YOUTUBE_UPLOAD_RETRIES: Consecutive failed chunks before giving up (default: 5)
+
+Rendered videos are cached by image hash, duration, audio file and scale, so
+posting an image again needs no encoding. The bot calls prepare() with the
+next scheduled image so rendering happens in the background between posts.
+
+Access tokens are reused until shortly before they expire. Videos are sent
+in chunks over a resumable upload session; after a failed chunk the server
+is asked which bytes it already has and the upload continues from there.
 
 OAuth2 Setup:
 1. Create a Google Cloud project and enable YouTube Data API v3
@@ -18,17 +32,32 @@ OAuth2 Setup:
 """
 
 import os
+import hashlib
 import subprocess
 import logging
-import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import json
 
 import requests
 
+from captions import caption_hashtags, caption_title
+from content_cache import content_hash, get_cache_dir
+
 logger = logging.getLogger(__name__)
 
+# Bump when the encoding settings change so cached renders are not reused
+RENDER_VERSION = '1'
+
+# Refresh access tokens this many seconds before they expire
+TOKEN_EXPIRY_SKEW = 60
+
+# Resumable upload chunks must be a multiple of 256 KiB
+UPLOAD_CHUNK_UNIT = 256 * 1024
+
 
 class YouTubePoster:
     """Handler for posting videos to YouTube from static images."""
@@ -45,6 +74,25 @@ class YouTubePoster:
         
         self.video_duration = int(os.getenv('YOUTUBE_VIDEO_DURATION', '5'))
         self.audio_file = os.getenv('YOUTUBE_AUDIO_FILE')
+        self.scale = os.getenv('YOUTUBE_VIDEO_SCALE', '1280:720')
+        self.fps = os.getenv('YOUTUBE_VIDEO_FPS', '2')
+        self.preset = os.getenv('YOUTUBE_X264_PRESET', 'veryfast')
+        self.cache_max = int(os.getenv('YOUTUBE_VIDEO_CACHE_MAX', '50'))
+        self.video_dir = get_cache_dir() / 'videos'
+        chunk_mb = float(os.getenv('YOUTUBE_UPLOAD_CHUNK_MB', '8'))
+        self.chunk_size = max(1, int(chunk_mb * 1024 * 1024) // UPLOAD_CHUNK_UNIT) * UPLOAD_CHUNK_UNIT
+        self.upload_retries = int(os.getenv('YOUTUBE_UPLOAD_RETRIES', '5'))
+        self.session = requests.Session()
+
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+        # ffmpeg runs as a child process, so one thread per render is enough
+        self._renderer = ThreadPoolExecutor(max_workers=int(os.getenv('YOUTUBE_RENDER_WORKERS', '1')),
+                                            thread_name_prefix='youtube-render')
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
         
         # Check for ffmpeg
         try:
@@ -52,7 +100,14 @@ class YouTubePoster:
         except (subprocess.CalledProcessError, FileNotFoundError):
             raise ValueError("ffmpeg is required for video generation. Install ffmpeg and ensure it's in PATH.")
 
-    def _get_access_token(self) -> Optional[str]:
+    def _get_access_token(self, force_refresh: bool = False) -> Optional[str]:
+        """Return a cached access token, refreshing it when it is about to expire."""
+        with self._token_lock:
+            if not force_refresh and self._access_token and time.monotonic() < self._token_expires_at:
+                return self._access_token
+            return self._refresh_access_token()
+
+    def _refresh_access_token(self) -> Optional[str]:
         """Get fresh access token using refresh token."""
         try:
             data = {
@@ -62,11 +117,14 @@ class YouTubePoster:
                 'grant_type': 'refresh_token'
             }
             
-            resp = requests.post('https://oauth2.googleapis.com/token', data=data, timeout=30)
+            resp = self.session.post('https://oauth2.googleapis.com/token', data=data, timeout=30)
             
             if resp.status_code == 200:
                 token_data = resp.json()
-                return token_data.get('access_token')
+                self._access_token = token_data.get('access_token')
+                expires_in = float(token_data.get('expires_in', 3600))
+                self._token_expires_at = time.monotonic() + max(0.0, expires_in - TOKEN_EXPIRY_SKEW)
+                return self._access_token
             else:
                 logger.error(f"Token refresh failed {resp.status_code}: {resp.text}")
                 return None
@@ -75,46 +133,91 @@ class YouTubePoster:
             logger.error(f"Error refreshing access token: {e}")
             return None
 
+    def _video_path(self, image_path: Path) -> Path:
+        """Cache location of the rendered video for an image and the current settings."""
+        audio = 'none'
+        if self.audio_file and Path(self.audio_file).exists():
+            audio = content_hash(Path(self.audio_file))
+        key = f"{content_hash(image_path)}-{self.video_duration}-{audio}-{self.scale}-{self.fps}-{self.preset}-{RENDER_VERSION}"
+        return self.video_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.mp4"
+
+    def _render(self, image_path: Path, output_path: Path) -> bool:
+        """Encode a still image (plus optional audio) to an MP4 at output_path."""
+        width, height = self.scale.split(':')
+        cmd = [
+            'ffmpeg', '-y',  # overwrite output
+            '-loop', '1',    # loop the image
+            '-framerate', self.fps,
+            '-i', str(image_path),
+        ]
+
+        # Add audio if specified
+        has_audio = bool(self.audio_file and Path(self.audio_file).exists())
+        if has_audio:
+            cmd.extend(['-i', self.audio_file])
+
+        cmd.extend([
+            '-t', str(self.video_duration),  # duration
+            # Scale with padding, then yuv420p for compatibility
+            '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease,'
+                   f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,format=yuv420p',
+            '-r', self.fps,
+            '-c:v', 'libx264', '-preset', self.preset, '-tune', 'stillimage',
+        ])
+        cmd.extend(['-c:a', 'aac', '-shortest'] if has_audio else ['-an'])
+        cmd.extend(['-movflags', '+faststart', '-f', 'mp4'])
+
+        tmp_path = output_path.with_suffix('.tmp')
+        cmd.append(str(tmp_path))
+
+        logger.info(f"Rendering video from {image_path.name}...")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.error(f"ffmpeg failed: {result.stderr}")
+            tmp_path.unlink(missing_ok=True)
+            return False
+
+        os.replace(tmp_path, output_path)
+        logger.info(f"Video created: {output_path}")
+        return True
+
+    def _prune_videos(self):
+        """Keep only the most recently used rendered videos."""
+        videos = sorted(self.video_dir.glob('*.mp4'), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in videos[self.cache_max:]:
+            old.unlink(missing_ok=True)
+
+    def prepare(self, image_path: Path) -> Future:
+        """Render the video for an image in the background ahead of posting."""
+        output_path = self._video_path(image_path)
+        with self._pending_lock:
+            future = self._pending.get(output_path.name)
+            if future is None:
+                future = self._renderer.submit(self._ensure_video, image_path, output_path)
+                self._pending[output_path.name] = future
+                future.add_done_callback(lambda _: self._pending.pop(output_path.name, None))
+            return future
+
+    def _ensure_video(self, image_path: Path, output_path: Path) -> Optional[Path]:
+        if output_path.exists():
+            output_path.touch()
+            return output_path
+
+        self.video_dir.mkdir(parents=True, exist_ok=True)
+        if not self._render(image_path, output_path):
+            return None
+        self._prune_videos()
+        return output_path
+
     def _create_video_from_image(self, image_path: Path) -> Optional[Path]:
-        """Create a short video from a static image using ffmpeg."""
+        """Return a video of the image, rendering it unless already cached or in progress."""
         try:
-            # Create temporary output file
-            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp:
-                output_path = Path(tmp.name)
-            
-            # Base ffmpeg command: static image for duration
-            cmd = [
-                'ffmpeg', '-y',  # overwrite output
-                '-loop', '1',    # loop the image
-                '-i', str(image_path),
-                '-t', str(self.video_duration),  # duration
-                '-pix_fmt', 'yuv420p',  # compatibility
-                '-vf', 'scale=1280:720:force_original_aspect_ratio=decrease:eval=frame,pad=1280:720:(ow-iw)/2:(oh-ih)/2',  # 720p with padding
-            ]
-            
-            # Add audio if specified
-            if self.audio_file and Path(self.audio_file).exists():
-                cmd.extend(['-i', self.audio_file, '-c:a', 'aac', '-shortest'])
-            else:
-                cmd.extend(['-an'])  # no audio
-            
-            cmd.extend(['-c:v', 'libx264', str(output_path)])
-            
-            logger.info(f"Creating video from {image_path.name}...")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode != 0:
-                logger.error(f"ffmpeg failed: {result.stderr}")
-                return None
-            
-            logger.info(f"Video created: {output_path}")
-            return output_path
-            
+            return self.prepare(image_path).result()
         except Exception as e:
             logger.error(f"Error creating video: {e}")
             return None
 
-    def _upload_video(self, video_path: Path, title: str, description: str) -> bool:
+    def _upload_video(self, video_path: Path, title: str, description: str, tags: Optional[list] = None) -> bool:
         """Upload video to YouTube."""
         try:
             access_token = self._get_access_token()
@@ -126,7 +229,7 @@ class YouTubePoster:
                 'snippet': {
                     'title': title,
                     'description': description,
-                    'tags': ['lain', 'serial experiments lain', 'anime'],
+                    'tags': ['lain', 'serial experiments lain', 'anime'] + (tags or []),
                     'categoryId': '24'  # Entertainment
                 },
                 'status': {
@@ -137,12 +240,21 @@ class YouTubePoster:
             # Upload in two steps: metadata then file
             headers = {
                 'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'X-Upload-Content-Type': 'video/mp4',
+                'X-Upload-Content-Length': str(video_path.stat().st_size)
             }
             
             # Initial request
             url = 'https://www.googleapis.com/upload/youtube/v3/videos?uploadType=resumable&part=snippet,status'
-            resp = requests.post(url, headers=headers, json=metadata, timeout=30)
+            resp = self.session.post(url, headers=headers, json=metadata, timeout=30)
+            if resp.status_code == 401:
+                # The cached token was revoked or expired early
+                access_token = self._get_access_token(force_refresh=True)
+                if not access_token:
+                    return False
+                headers['Authorization'] = f'Bearer {access_token}'
+                resp = self.session.post(url, headers=headers, json=metadata, timeout=30)
             
             if resp.status_code not in (200, 201):
                 logger.error(f"YouTube upload init failed {resp.status_code}: {resp.text}")
@@ -154,34 +266,106 @@ class YouTubePoster:
                 return False
             
             # Upload video file
-            with open(video_path, 'rb') as f:
-                video_headers = {
-                    'Content-Type': 'video/mp4',
-                    'Content-Length': str(video_path.stat().st_size)
-                }
-                
-                resp = requests.put(upload_url, headers=video_headers, data=f, timeout=300)
-            
-            if resp.status_code in (200, 201):
-                data = resp.json()
-                video_id = data.get('id')
-                logger.info(f"Video uploaded to YouTube: https://youtube.com/watch?v={video_id}")
-                return True
-            else:
-                logger.error(f"YouTube video upload failed {resp.status_code}: {resp.text}")
+            data = self._upload_chunks(upload_url, video_path)
+            if data is None:
                 return False
+            
+            video_id = data.get('id')
+            logger.info(f"Video uploaded to YouTube: https://youtube.com/watch?v={video_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"Error uploading to YouTube: {e}")
             return False
-        
-        finally:
-            # Clean up video file
-            try:
-                if video_path.exists():
-                    video_path.unlink()
-            except Exception:
-                pass
+
+    @staticmethod
+    def _received_bytes(resp: requests.Response) -> int:
+        """Bytes the server has stored, from the Range header of a 308 response."""
+        received = resp.headers.get('Range')
+        if not received:
+            return 0
+        return int(received.rsplit('-', 1)[1]) + 1
+
+    def _query_upload(self, upload_url: str, total: int) -> Tuple[Optional[int], Optional[dict]]:
+        """Ask the server how much of the upload it already has.
+
+        Returns:
+            Tuple of (offset to resume from, video resource if the upload is
+            already complete); offset is None if the session is gone
+        """
+        headers = {
+            'Authorization': f'Bearer {self._get_access_token()}',
+            'Content-Length': '0',
+            'Content-Range': f'bytes */{total}'
+        }
+        resp = self.session.put(upload_url, headers=headers, timeout=30)
+        if resp.status_code == 308:
+            return self._received_bytes(resp), None
+        if resp.status_code in (200, 201):
+            return total, resp.json()
+        if resp.status_code in (404, 410):
+            logger.error(f"YouTube upload session expired ({resp.status_code})")
+            return None, None
+        raise requests.HTTPError(f"Upload status query returned {resp.status_code}", response=resp)
+
+    def _upload_chunks(self, upload_url: str, video_path: Path) -> Optional[dict]:
+        """Send the file in chunks, resuming from the server's offset after failures.
+
+        Returns:
+            The uploaded video resource, or None if the upload failed
+        """
+        total = video_path.stat().st_size
+        offset = 0
+        failures = 0
+
+        with open(video_path, 'rb') as f:
+            while True:
+                try:
+                    f.seek(offset)
+                    chunk = f.read(self.chunk_size)
+                    headers = {
+                        'Authorization': f'Bearer {self._get_access_token()}',
+                        'Content-Type': 'video/mp4',
+                        'Content-Range': f'bytes {offset}-{offset + len(chunk) - 1}/{total}'
+                    }
+                    resp = self.session.put(upload_url, headers=headers, data=chunk, timeout=120)
+
+                    if resp.status_code in (200, 201):
+                        return resp.json()
+                    if resp.status_code == 308:
+                        offset = self._received_bytes(resp)
+                        failures = 0
+                        continue
+                    if resp.status_code in (404, 410):
+                        logger.error(f"YouTube upload session expired ({resp.status_code})")
+                        return None
+                    if resp.status_code == 401:
+                        self._get_access_token(force_refresh=True)
+                    elif resp.status_code < 500:
+                        logger.error(f"YouTube video upload failed {resp.status_code}: {resp.text}")
+                        return None
+                    logger.warning(f"YouTube chunk at byte {offset} failed with {resp.status_code}")
+                except requests.RequestException as e:
+                    logger.warning(f"YouTube chunk at byte {offset} failed: {e}")
+
+                failures += 1
+                if failures > self.upload_retries:
+                    logger.error(f"YouTube upload gave up after {failures} failed attempts at byte {offset}")
+                    return None
+                time.sleep(min(2 ** failures, 30))
+
+                # Continue from whatever the server actually stored
+                try:
+                    resumed, data = self._query_upload(upload_url, total)
+                except requests.RequestException as e:
+                    logger.warning(f"YouTube upload status query failed: {e}")
+                    continue
+                if data is not None:
+                    return data
+                if resumed is None:
+                    return None
+                logger.info(f"Resuming YouTube upload at byte {resumed}/{total}")
+                offset = resumed
 
     def post(self, image_path: Path, text: str) -> bool:
         """Create video from image and upload to YouTube."""
@@ -192,11 +376,13 @@ class YouTubePoster:
                 return False
             
             # Generate title and description
-            title = f"Lain Iwakura - {text[:50]}"
+            # (YouTube titles are limited to 100 characters)
+            title = f"Lain Iwakura - {caption_title(text, 80)}"
             description = f"{text}\n\n#SerialExperimentsLain #Lain #Anime"
+            tags = [tag.lstrip('#') for tag in caption_hashtags(text)]
             
             # Upload to YouTube
-            return self._upload_video(video_path, title, description)
+            return self._upload_video(video_path, title, description, tags)
             
         except Exception as e:
             logger.error(f"YouTube posting error: {e}")
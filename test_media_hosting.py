@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script for S3 media hosting.
+
+Runs against an in-process moto S3 server (pip install "moto[server]"), or
+against a real S3-compatible store (e.g. MinIO) when S3_ENDPOINT_URL or
+AWS_ENDPOINT_URL is set together with AWS_S3_BUCKET, AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY. A MinIO bucket must allow anonymous downloads
+(mc anonymous set download ...) for the cached-URL check to pass.
+
+Covers:
+  - upload, and skipping the upload when the object already exists
+  - failing over from a broken host to S3
+  - reusing a cached URL after a HEAD check, and re-uploading once the
+    object is gone
+"""
+
+import os
+import sys
+import socket
+import shutil
+import tempfile
+from pathlib import Path
+
+import requests
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _start_moto():
+    """Start a moto S3 server on a free port and point the S3 settings at it."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        return None
+
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    os.environ['S3_ENDPOINT_URL'] = f"http://127.0.0.1:{port}"
+    os.environ['AWS_S3_BUCKET'] = 'lain-media-test'
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    return server
+
+
+def _check(label: str, ok: bool) -> bool:
+    print(f"{'✅' if ok else '❌'} {label}")
+    return ok
+
+
+def test_media_hosting() -> bool:
+    """Test S3 upload, failover and cached URL verification."""
+    server = None
+    if not (os.getenv('S3_ENDPOINT_URL') or os.getenv('AWS_ENDPOINT_URL')):
+        server = _start_moto()
+        if server is None:
+            print("❌ No S3 endpoint available")
+            print("Install moto to run against an in-process server:")
+            print('  pip install "moto[server]"')
+            print("or point the script at MinIO:")
+            print("  S3_ENDPOINT_URL=http://localhost:9000 AWS_S3_BUCKET=... AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=...")
+            return False
+
+    work_dir = Path(tempfile.mkdtemp(prefix='lain-media-test-'))
+    os.environ['CACHE_DIR'] = str(work_dir / 'cache')
+    os.environ['S3_PRESIGN'] = 'false'
+    os.environ['MEDIA_URL_VERIFY'] = 'true'
+    os.environ['MEDIA_HOSTING_PROVIDER'] = 'local,s3'
+    os.environ['MEDIA_LOCAL_DIR'] = str(work_dir / 'served')
+    os.environ['MEDIA_LOCAL_BIND'] = '127.0.0.1'
+    os.environ['MEDIA_LOCAL_PORT'] = str(_free_port())
+    os.environ['MEDIA_LOCAL_PUBLIC_URL'] = f"http://127.0.0.1:{os.environ['MEDIA_LOCAL_PORT']}"
+
+    from media_hosting import MediaHostingManager, S3MediaHost
+
+    ok = True
+    try:
+        # Random content, so a shared bucket never already holds the object
+        image_path = work_dir / 'lain.jpg'
+        image_path.write_bytes(b'\xff\xd8\xff\xe0' + os.urandom(4096))
+
+        s3_host = S3MediaHost()
+        try:
+            s3_host.s3.head_bucket(Bucket=s3_host.bucket)
+        except Exception:
+            s3_host.s3.create_bucket(Bucket=s3_host.bucket)
+
+        puts = []
+        s3_host.s3.meta.events.register('before-call.s3.PutObject', lambda **kwargs: puts.append(1))
+        print(f"🔧 Bucket {s3_host.bucket} at {s3_host.endpoint_url}")
+        print()
+
+        print("📤 Upload")
+        url = s3_host.upload(image_path)
+        resp = requests.get(url, timeout=10)
+        ok &= _check(f"uploaded and served: {url}", resp.status_code == 200 and resp.content == image_path.read_bytes())
+        ok &= _check("second upload skipped (object exists)", s3_host.upload(image_path) == url and len(puts) == 1)
+        key = f"lain-social/{url.rsplit('/', 1)[-1]}"
+        s3_host.s3.delete_object(Bucket=s3_host.bucket, Key=key)
+        puts.clear()
+        print()
+
+        print("🔀 Failover")
+        manager = MediaHostingManager()
+        # Removing the served directory makes the local host fail its upload
+        shutil.rmtree(os.environ['MEDIA_LOCAL_DIR'])
+        hosted = manager.upload_image(image_path)
+        ok &= _check(f"local host failed, S3 answered: {hosted}", hosted == url and len(puts) == 1)
+        ok &= _check("local host cooling down", manager._ordered_providers()[0] == 's3')
+        print()
+
+        print("🔁 Cached URL")
+        ok &= _check("cached URL reused without uploading", manager.upload_image(image_path) == url and len(puts) == 1)
+        s3_host.s3.delete_object(Bucket=s3_host.bucket, Key=key)
+        ok &= _check("object deleted, cached URL fails HEAD", not manager._is_reachable(url))
+        ok &= _check("re-uploaded after HEAD check failed", manager.upload_image(image_path) == url and len(puts) == 2)
+        ok &= _check("re-uploaded object is served", requests.head(url, timeout=10).status_code == 200)
+        print()
+
+        s3_host.s3.delete_object(Bucket=s3_host.bucket, Key=key)
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        ok = False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if server is not None:
+            server.stop()
+
+    print("🎉 All media hosting checks passed" if ok else "❌ Some media hosting checks failed")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_media_hosting() else 1)
@@ -71,6 +71,8 @@ def test_openrouter():
     except Exception as e:
         print(f"❌ Error generating comment: {e}")
         print("   Check your API key and network connection")
+    finally:
+        comment_generator.close()
 
 if __name__ == "__main__":
     test_openrouter()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test script for the token bucket rate limiter.
+Run directly or with pytest.
+"""
+
+import sys
+import threading
+
+from rate_limit import RateLimiter
+
+
+def test_burst_then_wait():
+    limiter = RateLimiter(5)
+    for _ in range(5):
+        assert limiter.try_acquire() == 0.0
+    assert 0.15 < limiter.try_acquire() <= 0.2
+
+
+def test_tokens_above_burst():
+    """Requests larger than the burst pass once the bucket is full, then pay off the debt."""
+    limiter = RateLimiter(5)
+    assert limiter.try_acquire(10) == 0.0
+    # 5 tokens overdrawn plus the 1 requested, refilling at 5/s
+    assert 1.1 < limiter.try_acquire(1) <= 1.2
+
+    limiter = RateLimiter(50)
+    limiter.try_acquire(50)
+    done = threading.Event()
+    threading.Thread(target=lambda: (limiter.acquire(100), done.set()), daemon=True).start()
+    assert done.wait(timeout=3), "acquire(tokens > burst) never returned"
+
+
+def test_disabled():
+    limiter = RateLimiter(0)
+    assert limiter.try_acquire(1000) == 0.0
+
+
+if __name__ == "__main__":
+    failed = 0
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {name}: {e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,185 @@
+"""Downscale and re-encode images before sending them to vision models.
+
+Vision models do not need full-resolution originals, and inlining a large
+PNG as a base64 data URL makes requests slow to upload and expensive in
+image tokens. VisionEncoder shrinks images to VISION_MAX_EDGE pixels on the
+longest side and re-encodes them as JPEG or WebP. An original that already
+fits within VISION_MAX_EDGE is sent as-is when re-encoding would not shrink it.
+Encoded payloads are cached on disk under CACHE_DIR/vision, keyed by content
+hash and encoding settings; files unused for VISION_CACHE_MAX_AGE_DAYS are
+removed, and only the VISION_CACHE_MAX most recently used are kept.
+"""
+
+import os
+import io
+import time
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from content_cache import content_hash, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+# Payload types that may be stored in the on-disk cache: every re-encode
+# format plus every original that is kept because it was already smaller
+_CACHE_EXTENSIONS = {
+    '.jpg': 'image/jpeg',
+    '.webp': 'image/webp',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+}
+
+
+class VisionEncoder:
+    """Prepares image payloads for multimodal requests."""
+
+    def __init__(self):
+        self.max_edge = int(os.getenv('VISION_MAX_EDGE', '1024'))
+        self.quality = int(os.getenv('VISION_QUALITY', '85'))
+        self.format = os.getenv('VISION_FORMAT', 'jpeg').lower()
+        if self.format not in _FORMATS:
+            logger.warning(f"Unsupported VISION_FORMAT '{self.format}', using jpeg")
+            self.format = 'jpeg'
+
+        self.cache_dir = get_cache_dir() / 'vision'
+        self.cache_max = int(os.getenv('VISION_CACHE_MAX', '500'))
+        self.cache_max_age = float(os.getenv('VISION_CACHE_MAX_AGE_DAYS', '30')) * 86400
+        self._memory: 'OrderedDict[str, Tuple[bytes, str]]' = OrderedDict()
+        self._memory_size = 32
+        self._lock = threading.Lock()
+
+    def encode(self, image_path: Path) -> Tuple[str, str]:
+        """Return the base64 payload and MIME type to send for an image.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            Tuple of (base64 string, MIME type)
+        """
+        data, mime_type = self.encode_bytes(image_path)
+        return base64.b64encode(data).decode('utf-8'), mime_type
+
+    def encode_bytes(self, image_path: Path) -> Tuple[bytes, str]:
+        """Return the (possibly downscaled) image bytes and MIME type."""
+        original_mime = MIME_TYPES.get(image_path.suffix.lower(), 'image/jpeg')
+        if self.max_edge <= 0:
+            return image_path.read_bytes(), original_mime
+
+        pil_format, mime_type = _FORMATS[self.format]
+        key = f"{content_hash(image_path)}-{self.format}-{self.max_edge}-q{self.quality}-v2"
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        result = self._read_cached(key)
+        if result is None:
+            original = image_path.read_bytes()
+            try:
+                encoded, original_size = self._transcode(original, pil_format)
+            except Exception as e:
+                logger.warning(f"Could not downscale {image_path.name}, sending original: {e}")
+                return original, original_mime
+
+            fits = max(original_size) <= self.max_edge
+            if fits and len(encoded) >= len(original) and image_path.suffix.lower() in MIME_TYPES:
+                # Already small enough; re-encoding would only cost quality
+                result = (original, original_mime)
+            else:
+                result = (encoded, mime_type)
+
+            logger.info(
+                f"Vision payload for {image_path.name}: {len(original) / 1024:.0f} KiB -> "
+                f"{len(result[0]) / 1024:.0f} KiB ({result[1]})"
+            )
+            self._write_cached(key, *result)
+
+        with self._lock:
+            self._memory[key] = result
+            while len(self._memory) > self._memory_size:
+                self._memory.popitem(last=False)
+        return result
+
+    def _read_cached(self, key: str) -> Optional[Tuple[bytes, str]]:
+        for extension, mime_type in _CACHE_EXTENSIONS.items():
+            cache_file = self.cache_dir / f"{key}{extension}"
+            if cache_file.exists():
+                try:
+                    data = cache_file.read_bytes()
+                    os.utime(cache_file)  # mark as recently used for eviction
+                except OSError:
+                    return None
+                return data, mime_type
+        return None
+
+    def _write_cached(self, key: str, data: bytes, mime_type: str):
+        extension = next(ext for ext, mime in _CACHE_EXTENSIONS.items() if mime == mime_type)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_file = self.cache_dir / f"{key}{extension}"
+        tmp_file = cache_file.with_suffix(cache_file.suffix + '.tmp')
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, cache_file)
+        self._prune_cache()
+
+    def _prune_cache(self):
+        """Drop cached payloads unused for too long, then all but the most recent."""
+        cutoff = time.time() - self.cache_max_age
+        entries = []
+        for cache_file in self.cache_dir.iterdir():
+            try:
+                mtime = cache_file.stat().st_mtime
+            except OSError:
+                continue
+            if mtime < cutoff:
+                cache_file.unlink(missing_ok=True)
+            else:
+                entries.append((mtime, cache_file))
+        entries.sort(reverse=True)
+        for _, cache_file in entries[max(0, self.cache_max):]:
+            cache_file.unlink(missing_ok=True)
+
+    def _transcode(self, data: bytes, pil_format: str) -> Tuple[bytes, Tuple[int, int]]:
+        """Downscale image bytes and re-encode them with Pillow.
+
+        Returns:
+            Tuple of (encoded bytes, original (width, height))
+        """
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            img.seek(0)  # first frame of animated images
+            img = img.copy()
+        original_size = img.size
+
+        img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+
+        if pil_format == 'JPEG' and img.mode != 'RGB':
+            rgba = img.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            img = background
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+
+        out = io.BytesIO()
+        img.save(out, format=pil_format, quality=self.quality, optimize=True)
+        return out.getvalue(), original_size